@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import subprocess
+
+from generate_log import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+
+# logs of the suite: name, size in megabytes, distinct urls, extension
+SCENARIOS = {
+    "small": (10, 10000, "plain"),
+    "medium": (100, 100000, "gz"),
+    "cardinality": (100, 1000000, "plain"),
+    "1gb": (1024, 100000, "gz"),
+    "10gb": (10240, 1000000, "gz"),
+    "10m-urls": (2048, 10000000, "plain"),
+}
+DEFAULT_SCENARIOS = ("small", "medium", "cardinality")
+
+# settings of analyzer that are compared on every log
+MODES = {
+    "serial": {},
+    "workers": {"WORKERS": os.cpu_count() or 1},
+    "mmap": {"MMAP_PLAIN": True},
+    "spill": {"MAX_MEMORY_MB": 64},
+}
+
+
+def log_path(work_dir, scenario, seed):
+    """
+    The function generates log of "scenario" in "work_dir" once
+    and returns its path. Name of log has all parameters of generator.
+    """
+    size_mb, urls, ext = SCENARIOS[scenario]
+    log_dir = os.path.join(work_dir, f"{scenario}-{size_mb}mb-{urls}urls-seed{seed}")
+    path = os.path.join(log_dir, f"nginx-access-ui.log-20170629.{ext}")
+    if not os.path.exists(path):
+        os.makedirs(log_dir, exist_ok=True)
+        # log gets its name only when it is complete
+        generating = os.path.join(log_dir, f"generating.{ext}")
+        generate(generating, size_mb, urls, seed=seed)
+        os.replace(generating, path)
+    return path
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(path, settings, report_dir):
+    """
+    The function runs log_analyzer on log "path" with "settings"
+    in separate process and returns its run stats
+    """
+    shutil.rmtree(report_dir, ignore_errors=True)
+    os.makedirs(report_dir)
+    config_path = os.path.join(report_dir, "settings.cfg")
+    with open(config_path, "w") as file:
+        json.dump(dict(settings, LOG_DIR=os.path.dirname(path), REPORT_DIR=report_dir,
+                       CHECKPOINT_DIR=None, RUN_STATS=True,
+                       TEMPLATE=os.path.join(ROOT, "report.html")), file)
+    started = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(ROOT, "log_analyzer.py"), "--config", config_path],
+                   cwd=ROOT, check=True, capture_output=True)
+    wall = time.perf_counter() - started
+    with open(os.path.join(report_dir, "run-stats-2017.06.29.json")) as file:
+        stats = json.load(file)
+    stats["process_wall"] = wall
+    return stats
+
+
+def previous(results, record):
+    for old in reversed(results):
+        if old["scenario"] == record["scenario"] and old["mode"] == record["mode"]:
+            return old
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of log_analyzer on synthetic logs")
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=DEFAULT_SCENARIOS)
+    parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=sorted(MODES))
+    parser.add_argument('--work-dir', type=str, default=os.path.join(ROOT, "benchmarks", "data"),
+                        help='folder for generated logs and reports')
+    parser.add_argument('--results', type=str, default=RESULTS, help='file that results are appended to')
+    parser.add_argument('--seed', type=int, default=0, help='seed of log generator')
+    args = parser.parse_args()
+
+    results = []
+    if os.path.exists(args.results):
+        with open(args.results) as file:
+            results = [json.loads(line) for line in file if line.strip()]
+
+    revision = git_revision()
+    for scenario in args.scenarios:
+        path = log_path(args.work_dir, scenario, args.seed)
+        for mode in args.modes:
+            if mode == "mmap" and not path.endswith(".plain"):
+                continue
+            stats = run(path, MODES[mode], os.path.join(args.work_dir, "reports"))
+            record = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "revision": revision,
+                      "python": platform.python_version(), "scenario": scenario, "mode": mode,
+                      "log_bytes": os.path.getsize(path), "lines": stats["lines"], "errors": stats["errors"],
+                      "wall": stats["process_wall"], "cpu": stats["cpu"],
+                      "peak_rss_kb": stats["peak_rss_kb"], "children_peak_rss_kb": stats["children_peak_rss_kb"],
+                      "stages": {name: stage["wall"] for name, stage in stats["stages"].items()}}
+            old = previous(results, record)
+            change = f"{(record['wall'] / old['wall'] - 1) * 100:+.1f}%" if old else "new"
+            print(f"{scenario:12} {mode:8} {record['wall']:8.2f} s {record['lines'] / record['wall']:12.0f} lines/s "
+                  f"{record['peak_rss_kb'] or 0:10} KB  {change}")
+            results.append(record)
+            with open(args.results, "a") as file:
+                file.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
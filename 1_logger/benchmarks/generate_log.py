@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import gzip
+import random
+import argparse
+from array import array
+from bisect import bisect
+from itertools import accumulate
+from datetime import datetime, timedelta
+
+# approximate length of generated line, it is used to spread lines over a day
+LINE_BYTES = 210
+START = datetime(2017, 6, 29)
+
+TEMPLATES = ("/api/v2/banner/{id}",
+             "/api/1/photogenic_banners/list/?server_name=WIN7RB{id}",
+             "/api/v2/group/{id}/statistic/sites/?date_type=day&date_from=2017-06-28&date_to=2017-06-28",
+             "/export/appinstall_raw/2017-06-{day:02d}/?id={id}",
+             "/api/v2/slot/{id}/groups",
+             "/agency/banners_stats/{id}/?date_type=day&do=1&rt=banner&oi=5370438&as_json=1")
+AGENTS = ("Lynx/2.8.8dev.9 libwww-FM/2.14 SSL-MM/1.4.1 GNUTLS/2.10.5", "Python-urllib/2.7",
+          "Slotovod", "-", "Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko)",
+          "Configovod", "python-requests/2.13.0")
+STATUSES = (200,) * 40 + (404, 401, 400, 499, 500)
+
+
+def url_of(rank):
+    """
+    The function returns url of "rank" (0 is the most frequent)
+    """
+    return TEMPLATES[rank % len(TEMPLATES)].format(id=rank, day=rank % 28 + 1)
+
+
+def zipf_weights(urls, exponent):
+    """
+    The function returns array of cumulative Zipf weights of "urls" ranks
+    """
+    return array("d", accumulate(1 / (rank + 1) ** exponent for rank in range(urls)))
+
+
+def generate(path, size_mb, urls=10000, zipf=1.1, malformed=0.001, seed=0):
+    """
+    The function writes nginx "ui_short" log with about "size_mb" megabytes of lines
+    into "path" (gzipped if it ends with ".gz"). Urls are chosen
+    from "urls" ones by Zipf distribution with "zipf" exponent,
+    "malformed" part of lines is broken. The same arguments
+    always give the same file. It returns number of written lines.
+    """
+    rnd = random.Random(seed)
+    weights = zipf_weights(urls, zipf)
+    total = weights[-1]
+    # every url has its own typical request time
+    medians = array("d", (rnd.lognormvariate(-2, 1) for _ in range(min(urls, 100000))))
+    size = size_mb * 1024 * 1024
+    step = 86400 / max(size // LINE_BYTES, 1)
+
+    opener = gzip.open if path.endswith(".gz") else open
+    written = lines = 0
+    second, moment = None, None
+    with opener(path, "wb") as file:
+        buffer = []
+        while written < size:
+            rank = min(bisect(weights, rnd.random() * total), urls - 1)
+            if int(lines * step) != second:
+                second = int(lines * step)
+                moment = (START + timedelta(seconds=second)).strftime("%d/%b/%Y:%H:%M:%S")
+            request_time = medians[rank % len(medians)] * rnd.lognormvariate(0, 0.5)
+            line = (f'{rnd.randrange(1, 224)}.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(256)} '
+                    f'{"-" if rnd.random() < 0.7 else format(rnd.getrandbits(52), "x")}  - '
+                    f'[{moment} +0300] '
+                    f'"{"GET" if rnd.random() < 0.9 else "POST"} {url_of(rank)} HTTP/1.1" '
+                    f'{rnd.choice(STATUSES)} {rnd.randrange(10, 100000)} "-" "{rnd.choice(AGENTS)}" "-" '
+                    f'"{1498697422 + lines}-{rnd.getrandbits(31)}-4708-{9752759 + lines}" '
+                    f'"{format(rnd.getrandbits(36), "x") if rnd.random() < 0.5 else "-"}" '
+                    f'{request_time:.3f}\n')
+            if rnd.random() < malformed:
+                line = line[:rnd.randrange(len(line) // 2)] + "\n"
+            data = line.encode()
+            buffer.append(data)
+            written += len(data)
+            lines += 1
+            if len(buffer) >= 10000:
+                file.write(b"".join(buffer))
+                buffer.clear()
+        file.write(b"".join(buffer))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generator of synthetic nginx ui_short logs")
+    parser.add_argument('path', type=str, help='path of log file (.gz is compressed)')
+    parser.add_argument('--size-mb', type=int, default=100, help='size of log in megabytes')
+    parser.add_argument('--urls', type=int, default=10000, help='number of distinct urls')
+    parser.add_argument('--zipf', type=float, default=1.1, help='exponent of Zipf distribution of urls')
+    parser.add_argument('--malformed', type=float, default=0.001, help='part of broken lines')
+    parser.add_argument('--seed', type=int, default=0, help='seed of random generator')
+    args = parser.parse_args()
+    lines = generate(args.path, args.size_mb, args.urls, args.zipf, args.malformed, args.seed)
+    print(f"{lines} lines are written into {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,41 @@
 # -*- coding: utf-8 -*-
 
 
-# log_format ui_short '$remote_addr  $remote_user $http_x_real_ip [$time_local] "$request" '
-#                     '$status $body_bytes_sent "$http_referer" '
-#                     '"$http_user_agent" "$http_x_forwarded_for" "$http_X_REQUEST_ID" "$http_X_RB_USER" '
-#                     '$request_time';
 from src.service import service as sr
+from src.service import parallel
+from src.service import checkpoint
+from src.service import columnar
+from src.service import normalize
+from src.service import pipeline
+from src.service import mapped
+from src.service import spill
+from src.service import sample
+from src.service import approximate
+from src.service import grouping
+from src.service import timeseries
+from src.service import follow
+from src.service import profiling
 import logging
+import json
 import time
 from string import Template
 import sys
 import os
 import argparse
+import signal
+import threading
+from functools import partial
+from multiprocessing import Pool
 
 
 FILE_PATTERN = r'nginx-access-ui\.log-[0-9]{8}\.(gz|plain)'
 
+# log_format ui_short, spacing is the same as in lines of real logs
+LOG_FORMAT = ('$remote_addr $remote_user  $http_x_real_ip [$time_local] "$request" '
+              '$status $body_bytes_sent "$http_referer" '
+              '"$http_user_agent" "$http_x_forwarded_for" "$http_X_REQUEST_ID" "$http_X_RB_USER" '
+              '$request_time')
+
 
 config = {
     "REPORT_SIZE": 10,
@@ -24,9 +44,412 @@ config = {
     "LOG_DIR": "./log", "FILE_PATTERN": FILE_PATTERN,
     "LOG_FILE": None, "DEFAULT_CONFIG": "settings.cfg",
     "THRESHOLD_OF_ERRORS": 10, "TEMPLATE": "report.html",
+    "WORKERS": 1, "CHECKPOINT_DIR": None,
+    "LOG_FORMAT": LOG_FORMAT, "CACHE_DIR": None,
+    "NORMALIZE_URLS": False, "URL_RULES": [], "URL_CACHE_SIZE": normalize.CACHE_SIZE,
+    "READ_BLOCK_SIZE": pipeline.BLOCK_SIZE, "READ_QUEUE_DEPTH": pipeline.QUEUE_DEPTH,
+    "MMAP_PLAIN": False, "MAX_MEMORY_MB": None, "SPILL_DIR": None,
+    "SAMPLE_LINES": sample.SAMPLE_LINES, "SAMPLE_GZ_MB": sample.SAMPLE_GZ_MB,
+    "APPROXIMATE": False, "APPROXIMATE_RATE": approximate.SAMPLE_RATE,
+    "AGGREGATIONS": [], "TIME_BUCKET": None, "TIMESERIES_URLS": timeseries.TOP_URLS,
+    "FOLLOW_INTERVAL": follow.INTERVAL, "FOLLOW_WINDOWS": list(follow.WINDOWS), "FOLLOW_FORMAT": "html",
+    "REPORT_FORMATS": ["html"], "RUN_STATS": True, "PROFILE": False,
 }
 
 
+def report_name(date, approximated=False, extension="html"):
+    return f"report-{date.strftime('%Y.%m.%d')}{'-approximate' if approximated else ''}.{extension}"
+
+
+def errors_exceeded(active_config, errors, count):
+    """
+    The function checks if percent of unparsed lines among
+    "count" parsed and "errors" unparsed ones is over "THRESHOLD_OF_ERRORS"
+    """
+    total = count + errors
+    return bool(total) and errors / total * 100 > active_config["THRESHOLD_OF_ERRORS"]
+
+
+def make_normalizer(active_config):
+    """
+    The function returns url normalizer selected by "active_config" or None
+    """
+    if not active_config["NORMALIZE_URLS"]:
+        return None
+    return normalize.UrlNormalizer(active_config["URL_RULES"], cache_size=active_config["URL_CACHE_SIZE"])
+
+
+def checkpoint_settings(active_config):
+    """
+    The function returns settings that change aggregate of a file,
+    checkpoints are kept apart for every of them
+    """
+    return {key: active_config[key] for key in ("LOG_FORMAT", "NORMALIZE_URLS", "URL_RULES")}
+
+
+def make_reader(active_config):
+    """
+    The function returns pipelined reader(path, ext) of raw lines
+    """
+    return partial(pipeline.pipelined_lines, block_size=active_config["READ_BLOCK_SIZE"],
+                   queue_depth=active_config["READ_QUEUE_DEPTH"])
+
+
+def timed_records(records, stats, batch_lines=profiling.BATCH_LINES):
+    """
+    The function counts time of reading and parsing of "records"
+    into "parse" stage of "stats" if they are set
+    """
+    return stats.timed("parse", records, batch_lines) if stats is not None else records
+
+
+def read_records(active_config, searched_file, errors_counter, reader, stats=None, batch_lines=sr.BATCH_LINES):
+    """
+    The function returns generator of raw (url, request_time) records
+    of "searched_file". Plain file is memory mapped if "MMAP_PLAIN" is set.
+    Records are parsed and timed by batches of "batch_lines"
+    """
+    if active_config["MMAP_PLAIN"] and searched_file.ext == "plain":
+        records = mapped.mapped_records(searched_file.path, errors_counter, active_config["LOG_FORMAT"])
+    else:
+        records = sr.parser(searched_file.path, searched_file.ext, errors_counter,
+                            active_config["LOG_FORMAT"], reader=reader, batch_lines=batch_lines)
+    return timed_records(records, stats, batch_lines)
+
+
+def parsing_modes(active_config):
+    """
+    The function returns names of settings of "active_config" that select
+    ways of parsing of a file. "WORKERS" of "MAX_MEMORY_MB" aggregate
+    its partitions, so they are not a way of their own then
+    """
+    modes = [key for key in ("CACHE_DIR", "MAX_MEMORY_MB", "CHECKPOINT_DIR") if active_config[key]]
+    if active_config["WORKERS"] > 1 and not active_config["MAX_MEMORY_MB"]:
+        modes.append("WORKERS")
+    return modes
+
+
+def aggregate_file(active_config, searched_file, errors_counter, stats=None):
+    """
+    The function parses "searched_file" in the way
+    selected by "active_config" and returns "Aggregate".
+    Only one way may be selected, otherwise ValueError is raised
+    """
+    modes = parsing_modes(active_config)
+    if len(modes) > 1:
+        raise ValueError(f"{', '.join(modes)} can not be used together")
+    normalizer = make_normalizer(active_config)
+    reader = make_reader(active_config)
+
+    if active_config["CACHE_DIR"]:
+        # cache keeps raw urls, so only format of lines changes it
+        settings = {"LOG_FORMAT": active_config["LOG_FORMAT"]}
+        cache = columnar.load_cache(active_config["CACHE_DIR"], searched_file.path, settings)
+        if cache is not None:
+            logging.info(f"Using columnar cache of {searched_file.path}")
+            urls, ids, times, errors_counter[0] = cache
+            return columnar.aggregate_cache(urls, ids, times, normalizer)
+        logs = columnar.write_cache(active_config["CACHE_DIR"], searched_file.path,
+                                    read_records(active_config, searched_file, errors_counter, reader, stats),
+                                    errors_counter, settings)
+        return sr.Aggregate.from_records(normalizer(logs) if normalizer is not None else logs)
+    if active_config["MAX_MEMORY_MB"]:
+        # blocks queued by reader and batches of parsed lines are a part of memory limit too
+        budget = active_config["MAX_MEMORY_MB"] * spill.MB / 8
+        block_size = int(min(active_config["READ_BLOCK_SIZE"], budget / 2))
+        reader = partial(pipeline.pipelined_lines, block_size=block_size,
+                         queue_depth=max(1, min(int(budget / block_size), active_config["READ_QUEUE_DEPTH"])))
+        batch_lines = max(100, min(sr.BATCH_LINES, int(budget / spill.RECORD_BYTES)))
+        logs = read_records(active_config, searched_file, errors_counter, reader, stats, batch_lines)
+        return spill.spill_aggregate(normalizer(logs) if normalizer is not None else logs,
+                                     active_config["REPORT_SIZE"], active_config["MAX_MEMORY_MB"],
+                                     spill.partitions_count(searched_file.path, searched_file.ext,
+                                                            active_config["MAX_MEMORY_MB"],
+                                                            active_config["WORKERS"]),
+                                     spill_dir=active_config["SPILL_DIR"],
+                                     workers=active_config["WORKERS"])
+    if active_config["WORKERS"] > 1:
+        return parallel.parallel_aggregate(searched_file.path, searched_file.ext,
+                                           active_config["WORKERS"], errors_counter,
+                                           active_config["LOG_FORMAT"], normalizer, active_config["MMAP_PLAIN"],
+                                           stats)
+    if active_config["CHECKPOINT_DIR"]:
+        return checkpoint.checkpointed_aggregate(searched_file.path, searched_file.ext,
+                                                 active_config["CHECKPOINT_DIR"], errors_counter,
+                                                 log_format=active_config["LOG_FORMAT"],
+                                                 normalizer=normalizer,
+                                                 block_size=active_config["READ_BLOCK_SIZE"],
+                                                 queue_depth=active_config["READ_QUEUE_DEPTH"],
+                                                 settings=checkpoint_settings(active_config),
+                                                 mmap_plain=active_config["MMAP_PLAIN"],
+                                                 stats=stats)
+    logs = read_records(active_config, searched_file, errors_counter, reader, stats)
+    return sr.Aggregate.from_records(normalizer(logs) if normalizer is not None else logs)
+
+
+def approximate_file(active_config, searched_file, errors_counter, stats=None):
+    """
+    The function parses every "1 / APPROXIMATE_RATE" line of "searched_file"
+    and returns "Aggregate" of that sample
+    """
+    normalizer = make_normalizer(active_config)
+    reader = approximate.sampling_reader(make_reader(active_config),
+                                         approximate.stride(active_config["APPROXIMATE_RATE"]))
+    records = sr.parser(searched_file.path, searched_file.ext, errors_counter,
+                        active_config["LOG_FORMAT"], normalizer, reader)
+    return approximate.approximate_aggregate(timed_records(records, stats))
+
+
+def group_file(active_config, searched_file, errors_counter, stats=None):
+    """
+    The function parses "searched_file" once and returns tuple
+    (aggregate, groupings, series) with per url aggregate, aggregates
+    by keys of every item of "AGGREGATIONS" and time series
+    with buckets of "TIME_BUCKET" seconds (None if it is not set).
+    Grouping is done in one process in memory, so settings
+    of other ways of parsing raise ValueError
+    """
+    conflicts = parsing_modes(active_config)
+    if conflicts:
+        raise ValueError(f"AGGREGATIONS and TIME_BUCKET can not be used with {', '.join(conflicts)}")
+    groupings = [grouping.Grouping.from_config(item) for item in active_config["AGGREGATIONS"]]
+    series = None
+    if active_config["TIME_BUCKET"]:
+        series = timeseries.TimeSeries(active_config["TIME_BUCKET"], active_config["TIMESERIES_URLS"])
+    fields = grouping.fields(groupings, series)
+    records = sr.parser(searched_file.path, searched_file.ext, errors_counter, active_config["LOG_FORMAT"],
+                        reader=make_reader(active_config), fields=fields)
+    aggregate = grouping.grouped_aggregate(timed_records(records, stats), fields, groupings, make_normalizer(active_config), series)
+    return aggregate, groupings, series
+
+
+def make_report(active_config, searched_file, stats=None):
+    """
+    The function analyzes "searched_file" and writes its html report.
+    If "APPROXIMATE" is set, report is built from sample of lines.
+    Time of stages is collected into "stats" and written into
+    run-stats json next to report if "RUN_STATS" is set.
+    It returns "Aggregate" of the file or None if analysis has failed
+    """
+    logging.info(f"Please wait. Analyze of {searched_file.path} in progress... ")
+    stats = stats or profiling.RunStats()
+    date = searched_file.date.strftime('%Y.%m.%d') + ("-approximate" if active_config["APPROXIMATE"] else "")
+
+    # checking sample of lines before parsing of whole file
+    if active_config["SAMPLE_LINES"]:
+        with stats.stage("sample"):
+            errors, sampled = sample.estimate_errors(searched_file.path, searched_file.ext,
+                                                     active_config["LOG_FORMAT"], active_config["SAMPLE_LINES"],
+                                                     active_config["SAMPLE_GZ_MB"])
+        if errors_exceeded(active_config, errors, sampled - errors):
+            logging.info(f"Analysis has faild. Could not parse {errors:.0f} of {sampled} sampled lines. "
+                         "Error threshold exceeded")
+            return None
+
+    # parsing data from log file
+    errors_counter = [0]
+    groupings, series = [], None
+    profile = os.path.join(active_config["REPORT_DIR"], f"run-profile-{date}.prof") if active_config["PROFILE"] else None
+    with stats.stage("aggregate"), profiling.profiled(profile):
+        if active_config["APPROXIMATE"]:
+            logs = approximate_file(active_config, searched_file, errors_counter, stats)
+        elif active_config["AGGREGATIONS"] or active_config["TIME_BUCKET"]:
+            logs, groupings, series = group_file(active_config, searched_file, errors_counter, stats)
+        else:
+            logs = aggregate_file(active_config, searched_file, errors_counter, stats)
+    # checkpointed parsing counts lines and bytes it has read itself
+    if "parse" not in stats.counters:
+        stats.count("parse" if "parse" in stats.stages else "aggregate",
+                    lines=logs.count + errors_counter[0], bytes=os.path.getsize(searched_file.path),
+                    errors=errors_counter[0])
+    if errors_exceeded(active_config, errors_counter[0], logs.count):
+        logging.info("Analysis has faild. Could not parse most of the log. Error threshold exceeded")
+        return None
+    if active_config["APPROXIMATE"]:
+        rows = partial(approximate.analyze_formater, active_config["REPORT_SIZE"], logs,
+                       approximate.stride(active_config["APPROXIMATE_RATE"]))
+    else:
+        rows = partial(sr.formated_rows, active_config["REPORT_SIZE"], logs)
+
+    with stats.stage("analyze"):
+        tables = [{"name": item.name, "rows": item.rows(logs.count, logs.time_sum, active_config["REPORT_SIZE"])}
+                  for item in groupings]
+        if series is not None:
+            series = series.to_dict([url for url, stat in logs.top(active_config["REPORT_SIZE"])])
+
+    # creating log files, rows are streamed into every of them
+    with stats.stage("write"):
+        for extension in active_config["REPORT_FORMATS"]:
+            path = os.path.join(active_config["REPORT_DIR"],
+                                report_name(searched_file.date, active_config["APPROXIMATE"], extension))
+            data = stats.timed("analyze", rows())
+            if extension == "html":
+                sr.write_log_file(template=active_config["TEMPLATE"], path=path,
+                                  data=data, tables=tables, series=series)
+            elif extension == "jsonl":
+                sr.write_json_lines(path, data)
+            elif extension == "csv":
+                sr.write_csv(path, data)
+            else:
+                raise ValueError(f"Unknown report format {extension}")
+
+    if active_config["RUN_STATS"]:
+        stats.write(os.path.join(active_config["REPORT_DIR"], f"run-stats-{date}.json"),
+                    log=searched_file.path, lines=logs.count + errors_counter[0], errors=errors_counter[0])
+    return logs
+
+
+def aggregates_dir(active_config):
+    """
+    The function returns folder where batch mode keeps aggregates of reported files
+    """
+    return os.path.join(active_config["REPORT_DIR"], "aggregates")
+
+
+def _batch_worker(args):
+    active_config, searched_file, report = args
+    try:
+        if report:
+            aggregate = make_report(active_config, searched_file)
+        else:
+            # day is reported already, only its aggregate is rebuilt for rollup
+            errors_counter = [0]
+            aggregate = aggregate_file(active_config, searched_file, errors_counter)
+            if errors_exceeded(active_config, errors_counter[0], aggregate.count):
+                logging.info(f"Could not parse most of {searched_file.path}. Error threshold exceeded")
+                return searched_file, None
+        if aggregate is not None:
+            # the whole file is aggregated, so it is saved as finished checkpoint
+            checkpoint.save_checkpoint(aggregates_dir(active_config), searched_file.path,
+                                       os.path.getsize(searched_file.path), 0, aggregate,
+                                       checkpoint_settings(active_config))
+        return searched_file, aggregate
+    except Exception:
+        logging.exception("Got exception")
+        return searched_file, None
+
+
+def load_aggregate(active_config, searched_file):
+    """
+    The function returns saved "Aggregate" of the whole "searched_file"
+    from aggregates of batch mode or from its checkpoint, or None
+    """
+    path = searched_file.path
+    for directory in (aggregates_dir(active_config), active_config["CHECKPOINT_DIR"]):
+        if not directory:
+            continue
+        state = checkpoint.load_checkpoint(directory, path, checkpoint_settings(active_config))
+        # checkpoint of plain file may cover only a part of grown file
+        if state is not None and state["size"] == os.path.getsize(path):
+            return state["aggregate"]
+    return None
+
+
+def batch(active_config):
+    """
+    The function writes reports for every log file in "LOG_DIR"
+    that has no report yet. Files are analyzed on "WORKERS" processes
+    (every file on one process). Aggregate of every file is saved
+    next to reports. Then rollup report of all files is built from
+    aggregates of that run and saved aggregates (or checkpoints)
+    of files that were analyzed before, files that were reported without
+    them are parsed again. Files that could not be analyzed
+    are left out of rollup and named in log.
+    Aggregates of "MAX_MEMORY_MB" keep the heaviest urls only,
+    so rollup can not be built with it and ValueError is raised.
+    """
+    if active_config["MAX_MEMORY_MB"]:
+        raise ValueError("Batch mode can not be used with MAX_MEMORY_MB")
+    files = sr.search_files(file_pattern=active_config["FILE_PATTERN"],
+                            path=active_config["LOG_DIR"])
+    if not files:
+        logging.info("There are no files for analize")
+        return
+
+    # .gz and .plain logs of the same day are different files
+    aggregates = {}
+    tasks = []
+    worker_config = dict(active_config, WORKERS=1)
+    for searched_file in files:
+        if not os.path.exists(os.path.join(active_config["REPORT_DIR"],
+                                           report_name(searched_file.date,
+                                                       extension=active_config["REPORT_FORMATS"][0]))):
+            tasks.append((worker_config, searched_file, True))
+            continue
+        aggregate = load_aggregate(active_config, searched_file)
+        if aggregate is not None:
+            aggregates[searched_file.path] = searched_file, aggregate
+        else:
+            tasks.append((worker_config, searched_file, False))
+
+    failed = []
+    with Pool(active_config["WORKERS"]) as pool:
+        for searched_file, aggregate in pool.imap_unordered(_batch_worker, tasks):
+            if aggregate is None:
+                failed.append(searched_file.path)
+                continue
+            aggregates[searched_file.path] = searched_file, aggregate
+            logging.info(f"Aggregate of {searched_file.path} is built")
+    if failed:
+        logging.error(f"Rollup report does not include {', '.join(sorted(failed))}")
+
+    if not aggregates:
+        logging.info("There are no aggregates for rollup report")
+        return
+
+    dates = sorted(searched_file.date for searched_file, aggregate in aggregates.values())
+    rollup = sr.Aggregate()
+    for searched_file, aggregate in aggregates.values():
+        rollup.merge(aggregate)
+    new_file = f"report-rollup-{dates[0].strftime('%Y.%m.%d')}-{dates[-1].strftime('%Y.%m.%d')}.html"
+    sr.write_log_file(template=active_config["TEMPLATE"],
+                      path=os.path.join(active_config["REPORT_DIR"], new_file),
+                      data=sr.analyze_formater(active_config["REPORT_SIZE"], rollup))
+    logging.info(f"Rollup report of {len(aggregates)} files is written into {new_file}")
+
+
+def write_snapshot(active_config, aggregates, errors):
+    """
+    The function writes report of rolling windows "aggregates"
+    ({minutes: Aggregate}) into "REPORT_DIR" as html report
+    (the longest window in main table) or as json snapshot.
+    File is replaced atomically, so readers never see partial one.
+    """
+    rows = {minutes: sr.analyze_formater(active_config["REPORT_SIZE"], aggregate)
+            for minutes, aggregate in aggregates.items()}
+    if active_config["FOLLOW_FORMAT"] == "json":
+        path = os.path.join(active_config["REPORT_DIR"], "report-live.json")
+        with open(path + ".tmp", "w") as file:
+            json.dump({"time": time.time(), "errors": errors,
+                       "windows": {str(minutes): window for minutes, window in rows.items()}}, file)
+    else:
+        path = os.path.join(active_config["REPORT_DIR"], "report-live.html")
+        longest = max(rows)
+        tables = [{"name": f"last {minutes} min", "rows": window}
+                  for minutes, window in sorted(rows.items()) if minutes != longest]
+        sr.write_log_file(template=active_config["TEMPLATE"], path=path + ".tmp",
+                          data=rows[longest], tables=tables)
+    os.replace(path + ".tmp", path)
+
+
+def live(active_config, path):
+    """
+    The function follows log file "path" that is being written
+    and rewrites live report every "FOLLOW_INTERVAL" seconds
+    until it is interrupted or terminated
+    """
+    logging.info(f"Following {path}")
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        follow.follow(path, partial(write_snapshot, active_config), active_config["LOG_FORMAT"],
+                      make_normalizer(active_config), active_config["FOLLOW_WINDOWS"],
+                      active_config["FOLLOW_INTERVAL"], active_config["READ_BLOCK_SIZE"], stop)
+    except KeyboardInterrupt:
+        pass
+    logging.info("Following is stopped")
+
+
 def main(config):
     """
     This is main function. The functions is designed
@@ -42,6 +465,18 @@ def main(config):
                             type=str,
                             default=active_config["DEFAULT_CONFIG"],
                             help='sets path to active_config file')
+        parser.add_argument('--batch',
+                            action='store_true',
+                            help='analyzes every log without report and writes rollup report')
+        parser.add_argument('--approximate',
+                            action='store_true',
+                            help='builds report from sample of lines of the last log')
+        parser.add_argument('--profile',
+                            action='store_true',
+                            help='dumps cProfile stats of parsing and aggregation next to report')
+        parser.add_argument('--follow',
+                            type=str,
+                            help='follows log file that is being written and rewrites live report')
 
         # set logging params
         logging.basicConfig(format='[%(asctime)s] %(levelname)s %(message)s',
@@ -53,39 +488,41 @@ def main(config):
         args = parser.parse_args()
         sr.set_config(args.config, active_config)
 
-        searched_file = sr.search_last_file(file_pattern=active_config["FILE_PATTERN"],
-                                            path=active_config["LOG_DIR"])
-        if searched_file.path is None:
-            logging.info("There are no files for analize")
-            sys.exit()
-
         if not os.path.exists(active_config["REPORT_DIR"]):
             os.makedirs(active_config["REPORT_DIR"])
 
-        new_file = f"report-{searched_file.date.strftime('%Y.%m.%d')}.html"
+        if args.profile:
+            active_config["PROFILE"] = True
 
-        # search all ready exists log file
-        if os.path.exists(os.path.join(active_config["REPORT_DIR"], new_file)):
-            logging.info(f"File with name {new_file} already exists")
+        if args.follow:
+            live(active_config, args.follow)
             sys.exit()
 
-        logging.info("Please wait. Analyze in progress... ")
+        if args.approximate:
+            active_config["APPROXIMATE"] = True
 
-        # parsing data from log file
-        errors_counter = [0]
-        logs = (sr.parser(searched_file.path, searched_file.ext, errors_counter))
-        data = sr.analyze_formater(active_config["REPORT_SIZE"], logs)
-        if errors_counter[0] / active_config["REPORT_SIZE"] * 100 > active_config["THRESHOLD_OF_ERRORS"]:
-            logging.info("Analysis has faild. Could not parse most of the log. Error threshold exceeded")
+        if args.batch:
+            # rollup report can not be built from samples
+            batch(dict(active_config, APPROXIMATE=False))
+            sys.exit()
+
+        stats = profiling.RunStats()
+        with stats.stage("search"):
+            searched_file = sr.search_last_file(file_pattern=active_config["FILE_PATTERN"],
+                                                path=active_config["LOG_DIR"])
+        if searched_file.path is None:
+            logging.info("There are no files for analize")
             sys.exit()
 
-        # creating path for log file
+        new_file = report_name(searched_file.date, active_config["APPROXIMATE"], active_config["REPORT_FORMATS"][0])
 
-        path = os.path.join(active_config["REPORT_DIR"], new_file)
+        # search all ready exists log file
+        if os.path.exists(os.path.join(active_config["REPORT_DIR"], new_file)):
+            logging.info(f"File with name {new_file} already exists")
+            sys.exit()
 
-        # creating log file
-        sr.write_log_file(template=active_config["TEMPLATE"], path=path,
-                          data=data)
+        if make_report(active_config, searched_file, stats) is None:
+            sys.exit()
 
         logging.info("Analysis was completed successfully")
 
@@ -0,0 +1,121 @@
+import os
+import math
+import random
+from itertools import islice
+
+from . import service as sr
+
+SAMPLE_RATE = 0.1
+# z-score of 95% confidence intervals
+Z_SCORE = 1.96
+# head of plain file that gives mean length of line
+HEAD_BYTES = 1024 * 1024
+
+
+def stride(rate):
+    """
+    The function returns stride of lines for sampling "rate"
+    """
+    return max(1, round(1 / rate))
+
+
+def sampling_reader(reader, step, seed=None):
+    """
+    The function returns reader(path, ext) that yields about every
+    "step" line of log. Lines of plain file are found by seeks, so
+    skipped lines are not read at all; lines of gz file are read
+    by "reader" and every "step" of them (starting from random one)
+    is yielded.
+    """
+    rnd = random.Random(seed)
+
+    def read(path, ext):
+        if ext != "gz":
+            return seeking_lines(path, step, rnd)
+        return islice(reader(path, ext), rnd.randrange(step), None, step)
+    return read
+
+
+def seeking_lines(path, step, rnd):
+    """
+    The function-generator divides plain file "path" into windows
+    of "step" lines of mean length (measured on head of file) and
+    yields the first line that starts after random offset in every window.
+    Chance of line to be yielded depends on length of previous line,
+    not on its own one, so sample is not biased by length of urls.
+    """
+    with open(path, "rb") as file:
+        head = file.read(HEAD_BYTES)
+        lines = head.count(b"\n")
+        if not lines:
+            file.seek(0)
+            yield from islice(file, rnd.randrange(step), None, step)
+            return
+        window = step * (head.rfind(b"\n") + 1) / lines
+        size = os.path.getsize(path)
+        position = 0
+        start = 0.0
+        while start < size:
+            offset = int(start + rnd.random() * window)
+            start += window
+            if offset < position:
+                # the line that contains offset is already passed
+                file.seek(position)
+            else:
+                file.seek(max(offset - 1, 0))
+                if offset:
+                    file.readline()
+            line = file.readline()
+            if not line:
+                return
+            position = file.tell()
+            yield line
+
+
+def approximate_aggregate(records):
+    """
+    The function aggregates sampled "records" and returns "Aggregate",
+    its stats keep sums of squared request_time that are needed
+    for confidence intervals
+    """
+    return sr.Aggregate.from_records(records)
+
+
+def analyze_formater(report_size, aggregate, step):
+    """
+    The function returns formated rows of report of sample
+    "aggregate" that has every "step" line of log.
+    Counts and sums are scaled up by "step", "count_perc_ci",
+    "time_perc_ci" and "time_avg_ci" are half-widths
+    of 95% confidence intervals of respective values.
+    """
+    rows = sr.analyze(aggregate, report_size)
+    lines = aggregate.count
+    total_squares = sum(stat.time_squares for stat in aggregate.urls.values())
+    time_mean = aggregate.time_sum / lines if lines else 0.0
+    # finite population correction, sample is "1 / step" of log
+    correction = math.sqrt(1 - 1 / step)
+
+    for row in rows:
+        count, url_squares = row["count"], aggregate.urls[row["url"]].time_squares
+        share = count / lines
+        count_error = math.sqrt(share * (1 - share) / lines)
+
+        ratio = row["time_sum"] / aggregate.time_sum if aggregate.time_sum else 0.0
+        residuals = url_squares * (1 - ratio) ** 2 + (total_squares - url_squares) * ratio ** 2
+        time_error = (math.sqrt(residuals / max(lines - 1, 1) / lines) / time_mean) if time_mean else 0.0
+
+        variance = (url_squares - count * row["time_avg"] ** 2) / (count - 1) if count > 1 else 0.0
+        avg_error = math.sqrt(max(variance, 0.0) / count)
+
+        row["count_perc_ci"] = Z_SCORE * correction * count_error * 100
+        row["time_perc_ci"] = Z_SCORE * correction * time_error * 100
+        row["time_avg_ci"] = Z_SCORE * correction * avg_error
+        row["count"] = count * step
+        row["time_sum"] *= step
+
+    for row in rows:
+        sr.format_row(row)
+        for key in ("count_perc_ci", "time_perc_ci", "time_avg_ci"):
+            row[key] = f"{row[key]:.3f}"
+    return rows
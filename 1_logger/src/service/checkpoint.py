@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import logging
+
+from . import service as sr
+from . import pipeline
+from . import mapped
+
+CHECKPOINT_BYTES = 64 * 1024 * 1024
+# file modified less than this time ago is treated as growing one
+GROWING_SECONDS = 5
+
+
+def checkpoint_path(checkpoint_dir, path, settings=None):
+    """
+    The function returns path of checkpoint file for log file "path"
+    parsed with "settings" (json-serializable parser and normalizer
+    settings), so aggregate of other settings is never resumed
+    """
+    return os.path.join(checkpoint_dir, f"{os.path.basename(path)}-{sr.settings_key(settings)}.json")
+
+
+def load_checkpoint(checkpoint_dir, path, settings=None):
+    """
+    The function returns saved state of log file "path" as dict
+    (path, size, mtime, offset, errors, aggregate) or None
+    if there is no checkpoint or the file was replaced since it was saved.
+    Compressed file can not be appended, so its checkpoint is used
+    only while the file is the same.
+    """
+    try:
+        with open(checkpoint_path(checkpoint_dir, path, settings)) as file:
+            state = json.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logging.exception("Got exception")
+        return None
+
+    stat = os.stat(path)
+    if stat.st_size < state["size"] or \
+            (stat.st_size == state["size"] and stat.st_mtime != state["mtime"]) or \
+            (path.endswith(".gz") and stat.st_size != state["size"]):
+        logging.info(f"Checkpoint of {path} is outdated")
+        return None
+    state["aggregate"] = sr.Aggregate.from_dict(state["aggregate"])
+    return state
+
+
+def save_checkpoint(checkpoint_dir, path, offset, errors, aggregate, settings=None):
+    """
+    The function saves state of analysis of log file "path"
+    """
+    # workers of batch mode may save states at the same time
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    stat = os.stat(path)
+    state = {"path": path, "size": stat.st_size, "mtime": stat.st_mtime,
+             "offset": offset, "errors": errors,
+             "aggregate": aggregate.to_dict()}
+    target = checkpoint_path(checkpoint_dir, path, settings)
+    with open(target + ".tmp", "w") as file:
+        json.dump(state, file)
+    os.replace(target + ".tmp", target)
+
+
+def growing(path, size):
+    """
+    The function checks if log file "path" of "size" bytes
+    at the start of parsing is still being written
+    """
+    stat = os.stat(path)
+    return stat.st_size != size or time.time() - stat.st_mtime < GROWING_SECONDS
+
+
+def checkpointed_aggregate(path, ext, checkpoint_dir, errors_counter,
+                           checkpoint_bytes=CHECKPOINT_BYTES, log_format=None,
+                           normalizer=None, block_size=pipeline.BLOCK_SIZE,
+                           queue_depth=pipeline.QUEUE_DEPTH, settings=None, mmap_plain=False, stats=None):
+    """
+    The function parses log file "path" (with extension "ext") from
+    the offset of its checkpoint and returns "Aggregate" of whole file.
+    State is saved into "checkpoint_dir" after every "checkpoint_bytes"
+    of parsed data, so crashed or repeated run parses only new bytes.
+    Checkpoints are kept per "settings" the file is parsed with.
+    Unfinished last line of a growing plain file is left for the next run.
+    Plain file is memory mapped if "mmap_plain" and "log_format" are set.
+    Parsing is timed into "parse" stage of "stats" if they are set,
+    lines, bytes and errors of this run only are counted there.
+    """
+    size = os.path.getsize(path)
+    state = load_checkpoint(checkpoint_dir, path, settings)
+    if state is None:
+        aggregate, offset, errors_counter[0] = sr.Aggregate(), 0, 0
+    else:
+        aggregate, offset, errors_counter[0] = state["aggregate"], state["offset"], state["errors"]
+        logging.info(f"Resume analysis of {path} from byte {offset}")
+    resumed = (offset, aggregate.count, errors_counter[0])
+
+    def timed(records):
+        return stats.timed("parse", records) if stats is not None else records
+
+    if mmap_plain and log_format and ext == "plain":
+        end = mapped.complete_lines_end(path, size) if growing(path, size) else size
+        for start, offset in mapped.line_ranges(path, offset, end, checkpoint_bytes):
+            records = timed(mapped.mapped_records(path, errors_counter, log_format, start, offset))
+            aggregate.update(normalizer(records) if normalizer is not None else records)
+            save_checkpoint(checkpoint_dir, path, offset, errors_counter[0], aggregate, settings)
+    else:
+        unsaved = 0
+        for block in pipeline.pipelined_blocks(path, ext, offset, block_size, queue_depth):
+            if not block.endswith(b"\n") and ext != "gz" and growing(path, size):
+                break
+            aggregate.update(timed(sr.parse_lines(block.splitlines(keepends=True), errors_counter,
+                                                  log_format, normalizer)))
+            offset += len(block)
+            unsaved += len(block)
+            if unsaved >= checkpoint_bytes:
+                save_checkpoint(checkpoint_dir, path, offset, errors_counter[0], aggregate, settings)
+                unsaved = 0
+        if unsaved:
+            save_checkpoint(checkpoint_dir, path, offset, errors_counter[0], aggregate, settings)
+
+    if stats is not None:
+        errors = errors_counter[0] - resumed[2]
+        stats.count("parse", lines=aggregate.count - resumed[1] + errors, bytes=offset - resumed[0], errors=errors)
+    return aggregate
@@ -0,0 +1,117 @@
+import os
+import json
+import mmap
+import logging
+from array import array
+
+from . import service as sr
+from .stats import UrlStat
+from . import vectorized
+
+FLUSH_ITEMS = 1024 * 1024
+
+
+def _paths(cache_dir, path, settings=None):
+    base = os.path.join(cache_dir, f"{os.path.basename(path)}-{sr.settings_key(settings)}")
+    return base + ".json", base + ".ids", base + ".times"
+
+
+def write_cache(cache_dir, path, records, errors_counter, settings=None):
+    """
+    The function-generator passes through (url, request_time) "records"
+    of log file "path" and writes them into "cache_dir" as columns:
+    url ids (uint32), request times (float32) and dictionary of urls.
+    Dictionary with state of source file is written after the last record,
+    so cache of interrupted run is never used. Caches are kept apart
+    for every parser "settings" (json-serializable).
+    """
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    meta_path, ids_path, times_path = _paths(cache_dir, path, settings)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    url_ids = {}
+    ids, times = array("I"), array("f")
+    with open(ids_path, "wb") as ids_file, open(times_path, "wb") as times_file:
+        for url, request_time in records:
+            url_id = url_ids.get(url)
+            if url_id is None:
+                url_id = url_ids[url] = len(url_ids)
+            ids.append(url_id)
+            times.append(request_time)
+            if len(ids) >= FLUSH_ITEMS:
+                ids.tofile(ids_file)
+                times.tofile(times_file)
+                del ids[:], times[:]
+            yield url, request_time
+        ids.tofile(ids_file)
+        times.tofile(times_file)
+
+    stat = os.stat(path)
+    with open(meta_path, "w") as file:
+        json.dump({"size": stat.st_size, "mtime": stat.st_mtime,
+                   "errors": errors_counter[0], "urls": list(url_ids)}, file)
+
+
+def _map(path, typecode):
+    with open(path, "rb") as file:
+        if not os.fstat(file.fileno()).st_size:
+            return memoryview(array(typecode))
+        return memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)).cast(typecode)
+
+
+def load_cache(cache_dir, path, settings=None):
+    """
+    The function returns tuple (urls, ids, times, errors) with cached columns
+    of log file "path" parsed with "settings" or None if there is no actual cache.
+    Columns are memory mapped, so nothing is read until it is used
+    """
+    meta_path, ids_path, times_path = _paths(cache_dir, path, settings)
+    try:
+        with open(meta_path) as file:
+            meta = json.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logging.exception("Got exception")
+        return None
+
+    stat = os.stat(path)
+    if (stat.st_size, stat.st_mtime) != (meta["size"], meta["mtime"]):
+        logging.info(f"Cache of {path} is outdated")
+        return None
+    return meta["urls"], _map(ids_path, "I"), _map(times_path, "f"), meta["errors"]
+
+
+def aggregate_cache(urls, ids, times, normalizer=None):
+    """
+    The function builds "Aggregate" from cached columns.
+    Cache keeps raw urls, so they are collapsed by "normalizer" here.
+    Vectorized engine is used if numpy is installed
+    """
+    aggregate = sr.Aggregate()
+    mapping = None
+    if normalizer is not None:
+        templates = {}
+        mapping = array("I", (templates.setdefault(normalizer.normalize(url), len(templates)) for url in urls))
+        urls = list(templates)
+    np = vectorized.np
+    if np is not None:
+        ids, times = np.frombuffer(ids, dtype=np.uint32), np.frombuffer(times, dtype=np.float32)
+        if mapping is not None:
+            ids = np.frombuffer(mapping, dtype=np.uint32)[ids]
+        for start in range(0, len(ids), vectorized.BATCH_LINES):
+            end = start + vectorized.BATCH_LINES
+            vectorized.update_arrays(aggregate, urls, ids[start:end], times[start:end])
+    else:
+        stats = [UrlStat() for _ in urls]
+        if mapping is not None:
+            ids = (mapping[url_id] for url_id in ids)
+        for url_id, request_time in zip(ids, times):
+            stats[url_id].add(request_time)
+        aggregate.urls = dict(zip(urls, stats))
+
+    aggregate.count = len(times)
+    aggregate.time_sum = sum(stat.time_sum for stat in aggregate.urls.values())
+    return aggregate
@@ -0,0 +1,194 @@
+import os
+import copy
+import math
+import time
+import threading
+from collections import deque
+
+from . import service as sr
+from . import pipeline
+
+# rolling windows in minutes
+WINDOWS = (1, 5, 15)
+SLICE_SECONDS = 10
+INTERVAL = 10
+POLL_SECONDS = 1
+
+
+class Tail:
+    """
+    The class reads lines appended to file "path" since previous call.
+    Reading starts from the end of file. When file is rotated (path
+    gets other inode) the rest of old file is read and new file is read
+    from its beginning, truncated file is read from its beginning too.
+    """
+
+    def __init__(self, path, block_size=pipeline.BLOCK_SIZE):
+        self.path = path
+        self.block_size = block_size
+        self.file = None
+        self.inode = None
+        self.tail = b""
+        self._open(from_end=True)
+
+    def _open(self, from_end=False):
+        try:
+            self.file = open(self.path, "rb")
+        except FileNotFoundError:
+            self.file = None
+            return
+        stat = os.fstat(self.file.fileno())
+        self.inode = (stat.st_dev, stat.st_ino)
+        if from_end:
+            self.file.seek(0, os.SEEK_END)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _read(self):
+        blocks = [self.tail]
+        blocks.extend(iter(lambda: self.file.read(self.block_size), b""))
+        data = b"".join(blocks)
+        cut = data.rfind(b"\n") + 1
+        self.tail = data[cut:]
+        return data[:cut].splitlines(keepends=True)
+
+    def read_lines(self):
+        """
+        The function returns list of complete raw lines
+        appended since previous call
+        """
+        if self.file is None:
+            self._open()
+            if self.file is None:
+                return []
+        lines = self._read()
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            # file is rotated but new one is not created yet
+            return lines
+        if (stat.st_dev, stat.st_ino) != self.inode:
+            if self.tail:
+                lines.append(self.tail)
+                self.tail = b""
+            self.close()
+            self._open()
+            if self.file is not None:
+                lines.extend(self._read())
+        elif stat.st_size < self.file.tell():
+            self.file.seek(0)
+            self.tail = b""
+            lines.extend(self._read())
+        return lines
+
+
+class RollingWindows:
+    """
+    The class keeps per-url aggregates of records for the last
+    "windows" minutes. Records are added into slices
+    of "slice_seconds" by their arrival time and into running
+    aggregate of every window. Slices that leave window are subtracted
+    from its aggregate, slices older than the longest window are dropped.
+    """
+
+    def __init__(self, windows=WINDOWS, slice_seconds=SLICE_SECONDS):
+        if not windows:
+            raise ValueError("At least one rolling window should be set")
+        self.windows = sorted(windows)
+        self.slice_seconds = slice_seconds
+        self.slices = deque()
+        self.merged = {minutes: sr.Aggregate() for minutes in self.windows}
+        # start of the oldest slice that is counted in window
+        self.counted = {minutes: -math.inf for minutes in self.windows}
+
+    def update(self, records, now):
+        start = int(now // self.slice_seconds * self.slice_seconds)
+        if not self.slices or self.slices[-1][0] != start:
+            self.slices.append((start, sr.Aggregate()))
+        batch = sr.Aggregate.from_records(records)
+        for merged in self.merged.values():
+            merged.merge(copy.deepcopy(batch))
+        self.slices[-1][1].merge(batch)
+        self.expire(now)
+
+    def expire(self, now):
+        for minutes in self.windows:
+            oldest = now - minutes * 60
+            expired = []
+            for start, aggregate in self.slices:
+                if start + self.slice_seconds > oldest:
+                    break
+                if start >= self.counted[minutes]:
+                    expired.append(aggregate)
+                    self.counted[minutes] = start + self.slice_seconds
+            if expired:
+                remaining = [aggregate for start, aggregate in self.slices if start >= self.counted[minutes]]
+                self._subtract(self.merged[minutes], expired, remaining)
+        oldest = now - self.windows[-1] * 60
+        while self.slices and self.slices[0][0] + self.slice_seconds <= oldest:
+            self.slices.popleft()
+
+    @staticmethod
+    def _subtract(merged, expired, remaining):
+        """
+        The function subtracts "expired" slices from "merged" aggregate.
+        Maximum of url is found again in "remaining" slices
+        only if it may come from expired one.
+        """
+        maxes = set()
+        for aggregate in expired:
+            merged.count -= aggregate.count
+            merged.time_sum -= aggregate.time_sum
+            for url, stat in aggregate.urls.items():
+                total = merged.urls[url]
+                if total.count == stat.count:
+                    del merged.urls[url]
+                    maxes.discard(url)
+                    continue
+                total.subtract(stat)
+                if stat.time_max >= total.time_max:
+                    maxes.add(url)
+        for url in maxes:
+            merged.urls[url].time_max = max(aggregate.urls[url].time_max
+                                            for aggregate in remaining if url in aggregate.urls)
+        if not merged.count:
+            merged.time_sum = 0
+
+    def aggregates(self, now):
+        """
+        The function returns dict {minutes: Aggregate} for every window.
+        Running aggregates are returned as they are, so they should not be changed
+        """
+        self.expire(now)
+        return dict(self.merged)
+
+
+def follow(path, snapshot, log_format=None, normalizer=None, windows=WINDOWS, interval=INTERVAL,
+           block_size=pipeline.BLOCK_SIZE, stop=None):
+    """
+    The function tails log file "path", parses appended lines
+    and calls snapshot(aggregates, errors) every "interval" seconds
+    with aggregates of rolling "windows". When nothing is appended
+    it sleeps, so CPU usage follows append rate.
+    It works until "stop" event is set.
+    """
+    stop = stop or threading.Event()
+    tail = Tail(path, block_size)
+    rolling = RollingWindows(windows)
+    errors_counter = [0]
+    next_snapshot = time.monotonic() + interval
+    try:
+        while not stop.is_set():
+            lines = tail.read_lines()
+            if lines:
+                rolling.update(sr.parse_lines(lines, errors_counter, log_format, normalizer), time.time())
+            if time.monotonic() >= next_snapshot:
+                snapshot(rolling.aggregates(time.time()), errors_counter[0])
+                next_snapshot = time.monotonic() + interval
+            if not lines:
+                stop.wait(min(POLL_SECONDS, max(next_snapshot - time.monotonic(), 0)))
+    finally:
+        tail.close()
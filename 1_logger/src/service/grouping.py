@@ -0,0 +1,114 @@
+import heapq
+
+from .stats import UrlStat
+from . import service as sr
+
+BASE_FIELDS = ("url", "request_time")
+# keys that are cut from variables of log format
+DERIVED_KEYS = {"minute": ("time_local", slice(0, 17))}
+METRICS = (("count", "count_perc", "time_sum", "time_perc", "time_avg", "time_max", "time_med")
+           + tuple(f"time_p{percentile}" for percentile in sr.PERCENTILES))
+
+
+class Grouping:
+    """
+    The class aggregates request_time by values of "group_by" keys
+    (variables of log format, "url" or "minute"). Every group is kept
+    as constant-size "UrlStat". Report table has "size" heaviest
+    groups with "metrics" columns.
+    """
+
+    def __init__(self, name, group_by, metrics=METRICS, size=None):
+        unknown = set(metrics) - set(METRICS)
+        if unknown:
+            raise ValueError(f"Unknown metrics {sorted(unknown)} of aggregation {name}")
+        self.name = name
+        self.group_by = list(group_by)
+        self.metrics = list(metrics)
+        self.size = size
+        self.groups = {}
+
+    @classmethod
+    def from_config(cls, item):
+        return cls(item.get("name", ", ".join(item["group_by"])), item["group_by"],
+                   item.get("metrics", METRICS), item.get("size"))
+
+    def add(self, key, request_time):
+        stat = self.groups.get(key)
+        if stat is None:
+            stat = self.groups[key] = UrlStat()
+        stat.add(request_time)
+
+    def rows(self, all_count, all_time, size=None):
+        """
+        The function returns formated rows of "size" heaviest groups,
+        percents are calculated of "all_count" requests and "all_time"
+        """
+        size = self.size or size
+        items = self.groups.items()
+        if size is not None:
+            items = heapq.nlargest(size, items, key=lambda item: item[1].time_sum)
+        else:
+            items = sorted(items, key=lambda item: item[1].time_sum, reverse=True)
+
+        rows = []
+        for key, stat in items:
+            values = sr.make_row(None, stat, all_count, all_time)
+            sr.format_row(values)
+            row = dict(zip(self.group_by, key))
+            row.update((metric, values[metric]) for metric in self.metrics)
+            rows.append(row)
+        return rows
+
+
+def fields(groupings, series=None):
+    """
+    The function returns tuple of fields of log format
+    that should be parsed for "groupings" and time "series"
+    """
+    result = list(BASE_FIELDS)
+    if series is not None:
+        result.append("time_local")
+    for grouping in groupings:
+        for key in grouping.group_by:
+            field = DERIVED_KEYS.get(key, (key,))[0]
+            if field not in result:
+                result.append(field)
+    return tuple(result)
+
+
+def _getter(position, key):
+    if key in DERIVED_KEYS:
+        cut = DERIVED_KEYS[key][1]
+        return lambda record: record[position][cut]
+    return lambda record: record[position]
+
+
+def grouped_aggregate(records, record_fields, groupings, normalizer=None, series=None):
+    """
+    The function aggregates "records" (tuples of values of "record_fields"
+    that start with url and request_time) in one pass: per url
+    into returned "Aggregate", by keys of every of "groupings"
+    and into time "series" if it is set.
+    """
+    normalize = normalizer.normalize if normalizer is not None else None
+    plan = []
+    for grouping in groupings:
+        getters = [_getter(record_fields.index(DERIVED_KEYS.get(key, (key,))[0]), key)
+                   for key in grouping.group_by]
+        plan.append((grouping.add, getters))
+    add_time = series.add if series is not None else None
+    time_local = record_fields.index("time_local") if series is not None else None
+
+    def urls():
+        for record in records:
+            if normalize is not None:
+                record = (normalize(record[0]),) + record[1:]
+            request_time = record[1]
+            for add, getters in plan:
+                add(tuple(getter(record) for getter in getters), request_time)
+            if add_time is not None:
+                add_time(record[0], record[time_local], request_time)
+            yield record[0], request_time
+
+    return sr.Aggregate.from_records(urls())
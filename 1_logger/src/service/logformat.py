@@ -0,0 +1,140 @@
+import re
+import logging
+from functools import lru_cache
+
+# fields that are not variables of log_format but are cut from them
+DERIVED_FIELDS = {"url": "request"}
+# converters of field values, other fields are decoded into str
+CONVERTERS = {"request_time": "float", "status": "int", "body_bytes_sent": "int"}
+# number of logged tracebacks of unparsed lines per "errors_counter"
+MAX_TRACEBACKS = 10
+
+
+def count_error(errors_counter):
+    """
+    The function counts unparsed line in "errors_counter" and logs
+    traceback of current exception for the first "MAX_TRACEBACKS" lines only
+    """
+    errors_counter[0] += 1
+    if errors_counter[0] <= MAX_TRACEBACKS:
+        logging.exception("Got exception")
+        if errors_counter[0] == MAX_TRACEBACKS:
+            logging.error("Too many unparsed lines, next tracebacks are not logged")
+
+
+def split_format(log_format):
+    """
+    The function splits nginx "log_format" string and returns
+    tuple (literals, names) where literals[i] is the text before
+    variable names[i] and literals[-1] is the text after the last one
+    """
+    parts = re.split(r"\$(\w+)", log_format)
+    return parts[0::2], parts[1::2]
+
+
+def split_segments(log_format):
+    """
+    The function splits "log_format" by quotes and returns list of
+    segments (literals, names) in the same form as "split_format".
+    nginx escapes quotes inside of values, so segments of format
+    are the same as segments of line splitted by quotes.
+    """
+    literals, names = split_format(log_format)
+    segments = [([""], [])]
+    for index, literal in enumerate(literals):
+        pieces = literal.split('"')
+        segments[-1][0][-1] += pieces[0]
+        for piece in pieces[1:]:
+            segments.append(([piece], []))
+        if index < len(names):
+            segments[-1][1].append(names[index])
+            segments[-1][0].append("")
+    return segments
+
+
+def _convert(name, value):
+    if name in CONVERTERS:
+        return f"{CONVERTERS[name]}({value})"
+    return f"{value}.decode('utf-8')"
+
+
+def _source(log_format, fields):
+    segments = split_segments(log_format)
+    places = {name: (number, index)
+              for number, (literals, names) in enumerate(segments)
+              for index, name in enumerate(names)}
+    for field in fields:
+        if DERIVED_FIELDS.get(field, field) not in places:
+            raise ValueError(f"Field {field} is not in log format")
+    last_literals, last_names = segments[-1]
+    last = last_names[-1] if last_names and not last_literals[-1] else None
+
+    code = []
+    values = {}
+    # the variable that ends line is cut from the right,
+    # it must not contain the separator before it
+    variables = {DERIVED_FIELDS.get(field, field) for field in fields}
+    if last in variables:
+        index = len(last_names) - 1
+        separator = last_literals[index] if index else '"' + last_literals[0]
+        code.append(f"v_{last} = line.rsplit({separator.encode()!r}, 1)[1]")
+        values[last] = f"v_{last}" if last in CONVERTERS else f"v_{last}.rstrip()"
+        variables.discard(last)
+
+    # other variables are cut from segments between quotes
+    numbers = sorted({places[name][0] for name in variables})
+    if numbers:
+        code.append(f"parts = line.split(b'\"', {numbers[-1] + 1})")
+    for number in numbers:
+        literals, names = segments[number]
+        needed = sorted(places[name][1] for name in variables if places[name][0] == number)
+        if len(names) == 1 and not literals[0] and not literals[1]:
+            values[names[0]] = f"parts[{number}]"
+            continue
+        code.append(f"rest = parts[{number}][{len(literals[0])}:]")
+        position = 0
+        for index in needed:
+            for skipped in range(position, index):
+                code.append(f"rest = rest.partition({literals[skipped + 1].encode()!r})[2]")
+            if literals[index + 1]:
+                code.append(f"v_{names[index]}, _, rest = rest.partition({literals[index + 1].encode()!r})")
+            else:
+                code.append(f"v_{names[index]} = rest")
+            values[names[index]] = f"v_{names[index]}"
+            position = index + 1
+
+    result = []
+    for field in fields:
+        value = values[DERIVED_FIELDS.get(field, field)]
+        if field == "url":
+            value = f"{value}.split(b' ', 2)[1]"
+        result.append(_convert(field, value))
+
+    body = "\n".join(" " * 12 + line for line in code)
+    return (
+        "def parse_block(lines, errors_counter):\n"
+        "    out = []\n"
+        "    append = out.append\n"
+        "    for line in lines:\n"
+        "        try:\n"
+        f"{body}\n"
+        f"            append(({', '.join(result)},))\n"
+        "        except Exception:\n"
+        "            count_error(errors_counter)\n"
+        "    return out\n"
+    )
+
+
+@lru_cache(maxsize=None)
+def compile_parser(log_format, fields=("url", "request_time")):
+    """
+    The function compiles nginx "log_format" definition into function
+    parse_block(lines, errors_counter) that parses list of raw (bytes)
+    lines and returns list of tuples with values of "fields".
+    Line is splitted by quotes only up to the last needed segment
+    and only requested values are decoded or converted, so quoted
+    values (like user agent) may contain spaces.
+    """
+    namespace = {"count_error": count_error}
+    exec(_source(log_format, tuple(fields)), namespace)
+    return namespace["parse_block"]
@@ -0,0 +1,96 @@
+import os
+import mmap
+
+from .logformat import split_segments, count_error
+
+
+def _layout(log_format):
+    """
+    The function returns tuple (quotes, separator): number of quotes
+    before "$request" and separator before the last variable
+    ("$request_time") of "log_format"
+    """
+    segments = split_segments(log_format)
+    quotes = [number for number, (literals, names) in enumerate(segments) if names == ["request"]]
+    literals, names = segments[-1]
+    if not quotes or names[-1:] != ["request_time"] or literals[-1]:
+        raise ValueError("Format must have quoted $request and end with $request_time")
+    separator = literals[-2] if len(names) > 1 else '"' + literals[0]
+    return quotes[0], separator.encode()
+
+
+def line_ranges(path, start, end, chunk_bytes):
+    """
+    The function splits bytes from "start" up to "end" of file "path"
+    into ranges (start, end) of about "chunk_bytes" bytes that end
+    right after line breaks (the last one ends at "end")
+    """
+    ranges = []
+    with open(path, "rb") as file:
+        while start < end:
+            file.seek(min(start + chunk_bytes, end))
+            if file.tell() < end:
+                file.readline()
+            stop = min(file.tell(), end)
+            ranges.append((start, stop))
+            start = stop
+    return ranges
+
+
+def complete_lines_end(path, size):
+    """
+    The function returns offset right after the last line break
+    among the first "size" bytes of file "path"
+    """
+    with open(path, "rb") as file:
+        if not size:
+            return 0
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return mapped.rfind(b"\n", 0, size) + 1
+    finally:
+        mapped.close()
+
+
+def mapped_records(path, errors_counter, log_format, start=0, end=None):
+    """
+    The function-generator memory maps plain log file "path" and yields
+    (url, request_time) for lines between "start" and "end" bytes.
+    Line breaks and fields are searched right in the mapped file,
+    only url and request_time slices are copied out of it.
+    Unparsed lines are counted in "errors_counter".
+    """
+    quotes, separator = _layout(log_format)
+    shift = len(separator)
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if not size:
+            return
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    find, rfind = mapped.find, mapped.rfind
+    end = size if end is None else end
+    pos = start
+    try:
+        while pos < end:
+            eol = find(b"\n", pos, end)
+            if eol < 0:
+                eol = end
+            try:
+                quote = pos - 1
+                for _ in range(quotes):
+                    quote = find(b'"', quote + 1, eol)
+                closing = find(b'"', quote + 1, eol)
+                url = find(b" ", quote, closing) + 1
+                url_end = find(b" ", url, closing)
+                if quote < 0 or closing < 0 or not url:
+                    raise ValueError(f"Request is not found in line at byte {pos}")
+                if url_end < 0:
+                    url_end = closing
+                request_time = rfind(separator, closing, eol) + shift
+                yield mapped[url:url_end].decode("utf-8"), float(mapped[request_time:eol])
+            except Exception:
+                count_error(errors_counter)
+            pos = eol + 1
+    finally:
+        mapped.close()
@@ -0,0 +1,45 @@
+import re
+from functools import lru_cache
+
+CACHE_SIZE = 100000
+
+ID_PATTERN = re.compile(r"\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+                        r"|(?=[a-fA-F]*\d)[0-9a-fA-F]{8,}")
+
+
+class UrlNormalizer:
+    """
+    The class collapses urls into route templates.
+    At first "rules" (list of pairs [regex, replacement]) are applied,
+    then query string is dropped and path segments that look like ids
+    (numbers, uuids, long hex strings) are replaced with "{id}".
+    Results are memoized per raw url in lru cache of "cache_size" items.
+    """
+
+    def __init__(self, rules=(), detect_ids=True, cache_size=CACHE_SIZE):
+        self.rules = [list(rule) for rule in rules]
+        self.detect_ids = detect_ids
+        self.cache_size = cache_size
+        self._compiled = [(re.compile(pattern), replacement) for pattern, replacement in self.rules]
+        self.normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def __reduce__(self):
+        return self.__class__, (self.rules, self.detect_ids, self.cache_size)
+
+    def _normalize(self, url):
+        for pattern, replacement in self._compiled:
+            url = pattern.sub(replacement, url)
+        if not self.detect_ids:
+            return url
+        path = url.partition("?")[0]
+        return "/".join("{id}" if ID_PATTERN.fullmatch(segment) else segment
+                        for segment in path.split("/"))
+
+    def __call__(self, records):
+        """
+        The function-generator yields (url, request_time) "records"
+        with normalized urls
+        """
+        normalize = self.normalize
+        for url, request_time in records:
+            yield normalize(url), request_time
@@ -0,0 +1,149 @@
+import os
+from multiprocessing import Pool
+
+from . import service as sr
+from . import pipeline
+from . import mapped
+from . import profiling
+
+# unparsed lines of worker process, one counter keeps one limit
+# of logged tracebacks for all tasks of the worker
+worker_errors = [0]
+
+
+def split_ranges(path, parts):
+    """
+    The function splits file "path" into "parts" byte ranges
+    and returns list of tuples (start, end).
+    Every range begins right after a line break, so no line
+    is shared between two ranges.
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as file:
+        for index in range(1, parts):
+            file.seek(max(size * index // parts, bounds[-1]))
+            if file.tell() > 0:
+                file.readline()
+            bounds.append(min(file.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _init_worker():
+    """
+    The function resets counter of unparsed lines in new worker process
+    """
+    worker_errors[0] = 0
+
+
+def _timed_aggregate(records):
+    """
+    The function aggregates "records" and returns tuple
+    (aggregate, wall, cpu) with time of their parsing
+    """
+    stats = profiling.RunStats()
+    aggregate = sr.Aggregate.from_records(stats.timed("parse", records))
+    parse = stats.stages["parse"]
+    return aggregate, parse["wall"], parse["cpu"]
+
+
+def _aggregate_lines(lines, log_format, normalizer):
+    """
+    The function parses "lines" and returns tuple
+    (aggregate, errors, parse wall time, parse CPU time)
+    """
+    errors = worker_errors[0]
+    aggregate, wall, cpu = _timed_aggregate(sr.parse_lines(lines, worker_errors, log_format, normalizer))
+    return aggregate, worker_errors[0] - errors, wall, cpu
+
+
+def range_lines(path, start, end, block_size=pipeline.BLOCK_SIZE):
+    """
+    The function-generator reads bytes from "start" up to "end"
+    of file "path" by blocks of "block_size" and yields their lines,
+    so memory does not depend on size of range
+    """
+    def blocks():
+        position = start
+        while position < end:
+            block = file.read(min(block_size, end - position))
+            if not block:
+                return
+            position += len(block)
+            yield block
+
+    with open(path, "rb") as file:
+        file.seek(start)
+        for block in pipeline.line_blocks(blocks()):
+            yield from block.splitlines()
+
+
+def _aggregate_range(args):
+    """
+    Worker of plain file. It reads and parses bytes from "start"
+    up to "end" of file "path" block by block
+    """
+    path, start, end, log_format, normalizer = args
+    return _aggregate_lines(range_lines(path, start, end), log_format, normalizer)
+
+
+def _aggregate_mapped(args):
+    """
+    Worker of memory mapped plain file. It parses lines
+    from "start" up to "end" right in the mapped file
+    """
+    path, start, end, log_format, normalizer = args
+    errors = worker_errors[0]
+    records = mapped.mapped_records(path, worker_errors, log_format, start, end)
+    aggregate, wall, cpu = _timed_aggregate(normalizer(records) if normalizer is not None else records)
+    return aggregate, worker_errors[0] - errors, wall, cpu
+
+
+def _aggregate_block(args):
+    """
+    Worker of gz file. It parses block of complete lines
+    """
+    block, log_format, normalizer = args
+    return _aggregate_lines(block.splitlines(), log_format, normalizer)
+
+
+def _iter_tasks(path, ext, workers, log_format, normalizer):
+    """
+    The function-generator yields arguments of workers for "path".
+    Plain file is splitted into byte ranges, gz file is decompressed
+    by reader thread and its blocks are fanned out to workers.
+    """
+    if ext == "gz":
+        for block in pipeline.pipelined_blocks(path, ext):
+            yield block, log_format, normalizer
+    else:
+        for start, end in split_ranges(path, workers * 4):
+            yield path, start, end, log_format, normalizer
+
+
+def parallel_aggregate(path, ext, workers, errors_counter, log_format=None, normalizer=None, mmap_plain=False,
+                       stats=None):
+    """
+    The function parses log file "path" (with extension "ext")
+    on "workers" processes and returns merged "Aggregate".
+    Lines are parsed with parser compiled from nginx "log_format" if it is set,
+    urls are collapsed by "normalizer" if it is set.
+    Ranges of plain file are memory mapped by workers if "mmap_plain"
+    and "log_format" are set.
+    Number of unparsed lines is added into "errors_counter".
+    Time of parsing in workers is summed into "parse" stage of "stats" if they are set
+    """
+    if ext == "gz":
+        worker = _aggregate_block
+    else:
+        worker = _aggregate_mapped if mmap_plain and log_format else _aggregate_range
+    result = sr.Aggregate()
+    with Pool(workers, initializer=_init_worker) as pool:
+        for aggregate, errors, wall, cpu in pool.imap(worker, _iter_tasks(path, ext, workers, log_format,
+                                                                          normalizer)):
+            result.merge(aggregate)
+            errors_counter[0] += errors
+            if stats is not None:
+                stats.add("parse", wall, cpu)
+    return result
@@ -0,0 +1,123 @@
+import zlib
+import queue
+import threading
+from functools import partial
+
+BLOCK_SIZE = 1024 * 1024
+QUEUE_DEPTH = 8
+
+_END = object()
+
+
+def _gz_blocks(file, block_size):
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for raw in iter(partial(file.read, block_size), b""):
+        while raw:
+            data = decompressor.decompress(raw, block_size)
+            if data:
+                yield data
+            if decompressor.eof:
+                # gzip file may consist of several members
+                raw = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                raw = decompressor.unconsumed_tail
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+def read_blocks(path, ext, offset=0, block_size=BLOCK_SIZE):
+    """
+    The function-generator reads file "path" by "block_size" bytes
+    and yields blocks of its (decompressed for "gz") content
+    starting from "offset" byte of content.
+    Blocks are not aligned to lines. zlib releases GIL while
+    decompressing, so it runs in parallel with parsing thread.
+    """
+    with open(path, "rb") as file:
+        if ext != "gz":
+            file.seek(offset)
+            yield from iter(partial(file.read, block_size), b"")
+            return
+        for data in _gz_blocks(file, block_size):
+            if offset >= len(data):
+                offset -= len(data)
+                continue
+            yield data[offset:] if offset else data
+            offset = 0
+
+
+def line_blocks(blocks):
+    """
+    The function-generator joins "blocks" of data
+    and yields blocks that end with complete line
+    """
+    tail = b""
+    for block in blocks:
+        block = tail + block
+        cut = block.rfind(b"\n") + 1
+        tail = block[cut:]
+        if cut:
+            yield block[:cut]
+    if tail:
+        yield tail
+
+
+def pipelined_blocks(path, ext, offset=0, block_size=BLOCK_SIZE, queue_depth=QUEUE_DEPTH):
+    """
+    The function-generator yields blocks of complete lines of file "path"
+    starting from "offset" byte of content. Only the last block may end
+    with unfinished line. Reading and decompression are done by separate
+    thread that passes blocks through queue of "queue_depth" items,
+    so I/O and zlib overlap with the work of consumer.
+    If "queue_depth" is 0 blocks are read in the calling thread.
+    """
+    if not queue_depth:
+        yield from line_blocks(read_blocks(path, ext, offset, block_size))
+        return
+
+    blocks = queue.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for block in line_blocks(read_blocks(path, ext, offset, block_size)):
+                if not put(block):
+                    return
+        except Exception as e:
+            put(e)
+        else:
+            put(_END)
+
+    thread = threading.Thread(target=produce, name="log-reader", daemon=True)
+    thread.start()
+    try:
+        while True:
+            block = blocks.get()
+            if block is _END:
+                break
+            if isinstance(block, Exception):
+                raise block
+            yield block
+    finally:
+        stop.set()
+        thread.join()
+
+
+def pipelined_lines(path, ext, block_size=BLOCK_SIZE, queue_depth=QUEUE_DEPTH):
+    """
+    The function-generator yields raw lines of file "path"
+    read by "pipelined_blocks"
+    """
+    for block in pipelined_blocks(path, ext, block_size=block_size, queue_depth=queue_depth):
+        yield from block.splitlines(keepends=True)
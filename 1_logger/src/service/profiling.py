@@ -0,0 +1,124 @@
+import json
+import time
+import cProfile
+from contextlib import contextmanager
+from itertools import islice
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# records are timed by batches, so timers cost nothing per record
+BATCH_LINES = 10000
+
+
+def _peak_rss(who):
+    if resource is None:
+        return None
+    return resource.getrusage(who).ru_maxrss
+
+
+class RunStats:
+    """
+    The class collects wall and CPU time of stages of one run.
+    Time of records pulled through "timed" iterable is counted
+    into its own stage and is subtracted from enclosing stage,
+    so lazy parsing and aggregation in one loop are told apart.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.frames = []
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+    def _add(self, name, wall, cpu):
+        stage = self.stages.setdefault(name, {"wall": 0.0, "cpu": 0.0})
+        stage["wall"] += wall
+        stage["cpu"] += cpu
+
+    @contextmanager
+    def stage(self, name):
+        frame = [0.0, 0.0]
+        self.frames.append(frame)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield self
+        finally:
+            self.frames.pop()
+            self._add(name, time.perf_counter() - wall - frame[0], time.process_time() - cpu - frame[1])
+
+    def add(self, name, wall, cpu):
+        """
+        The function adds time measured apart from this run (in worker
+        processes) to stage "name". It is not subtracted from enclosing
+        stage, as workers run in parallel with it.
+        """
+        self._add(name, wall, cpu)
+
+    def timed(self, name, iterable, batch=BATCH_LINES):
+        """
+        The function-generator yields items of "iterable" and counts
+        time of their production into stage "name"
+        """
+        iterator = iter(iterable)
+        while True:
+            wall, cpu = time.perf_counter(), time.process_time()
+            block = list(islice(iterator, batch))
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self._add(name, wall, cpu)
+            if self.frames:
+                self.frames[-1][0] += wall
+                self.frames[-1][1] += cpu
+            if not block:
+                return
+            yield from block
+
+    def count(self, name, **counters):
+        """
+        The function adds "counters" (lines, bytes, errors) to stage "name"
+        """
+        stage = self.counters.setdefault(name, {})
+        for key, value in counters.items():
+            stage[key] = stage.get(key, 0) + value
+
+    def to_dict(self):
+        """
+        The function returns json-serializable stats with
+        throughput of stages that have lines or bytes counted
+        """
+        stages = {}
+        for name, stage in self.stages.items():
+            stage = dict(stage, **self.counters.get(name, {}))
+            for key in ("lines", "bytes"):
+                if key in stage:
+                    stage[f"{key}_per_sec"] = stage[key] / stage["wall"] if stage["wall"] > 0 else None
+            stages[name] = stage
+        return {"stages": stages,
+                "wall": time.perf_counter() - self.wall, "cpu": time.process_time() - self.cpu,
+                "peak_rss_kb": _peak_rss(resource.RUSAGE_SELF) if resource else None,
+                "children_peak_rss_kb": _peak_rss(resource.RUSAGE_CHILDREN) if resource else None}
+
+    def write(self, path, **extra):
+        with open(path, "w") as file:
+            json.dump(dict(self.to_dict(), **extra), file, indent=2)
+
+
+@contextmanager
+def profiled(path):
+    """
+    The function-context manager dumps cProfile stats
+    of its body into "path" if it is set
+    """
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
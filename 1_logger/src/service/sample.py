@@ -0,0 +1,71 @@
+import os
+import random
+
+from . import service as sr
+from . import pipeline
+
+SAMPLE_LINES = 1000
+SAMPLE_GZ_MB = 4
+# bytes read back from random offset to find start of line
+LOOKBEHIND = 8192
+
+
+def sample_lines(path, ext, lines=SAMPLE_LINES, gz_mb=SAMPLE_GZ_MB, seed=None):
+    """
+    The function returns list of about "lines" tuples (line, weight)
+    of raw lines of log file "path" randomly spread across the file.
+    Lines of plain file are found by random seeks, so long lines
+    are met more often and get weight inversely proportional to length.
+    gz file can not be seeked, so lines are sampled uniformly
+    from its first "gz_mb" megabytes.
+    """
+    rnd = random.Random(seed)
+    limit = gz_mb * 1024 * 1024
+    if ext == "gz":
+        content = []
+        size = 0
+        for block in pipeline.read_blocks(path, ext):
+            content.append(block)
+            size += len(block)
+            if size >= limit:
+                break
+        content = b"".join(content)
+        if size >= limit:
+            # the last line may be cut
+            content = content[:content.rfind(b"\n") + 1]
+        found = content.splitlines(keepends=True)
+        return [(line, 1) for line in rnd.sample(found, min(lines, len(found)))]
+
+    size = os.path.getsize(path)
+    sampled = []
+    with open(path, "rb") as file:
+        if size <= limit:
+            found = file.readlines()
+            return [(line, 1) for line in rnd.sample(found, min(lines, len(found)))]
+        for offset in sorted(rnd.randrange(size) for _ in range(lines)):
+            # line that contains offset starts after the last line break before it
+            file.seek(max(0, offset - LOOKBEHIND))
+            head = file.read(offset - file.tell())
+            file.seek(offset - len(head) + head.rfind(b"\n") + 1)
+            line = file.readline()
+            sampled.append((line, 1 / len(line)))
+    return sampled
+
+
+def estimate_errors(path, ext, log_format=None, lines=SAMPLE_LINES, gz_mb=SAMPLE_GZ_MB, seed=None):
+    """
+    The function parses sample of lines of log file "path" and returns
+    tuple (errors, sampled) with estimated number of unparsed lines
+    among sampled ones and number of sampled lines
+    """
+    sampled = sample_lines(path, ext, lines, gz_mb, seed)
+    if not sampled:
+        return 0, 0
+    errors_counter = [0]
+    errors_weight = 0
+    for line, weight in sampled:
+        errors = errors_counter[0]
+        for _ in sr.parse_lines([line], errors_counter, log_format):
+            pass
+        errors_weight += (errors_counter[0] - errors) * weight
+    return errors_weight / sum(weight for _, weight in sampled) * len(sampled), len(sampled)
@@ -5,23 +5,31 @@ import os
 from datetime import datetime as dt
 import logging
 import json
+import heapq
+import csv
+import hashlib
 from string import Template
+from itertools import islice
+from .stats import UrlStat
+from .logformat import compile_parser, count_error
+from . import vectorized
 
 SelectedFile = namedtuple("SelectedFile", "date ext path")
 
+PERCENTILES = (90, 95, 99)
+BATCH_LINES = 10000
 
-def search_last_file(file_pattern, path):
+
+def search_files(file_pattern, path):
     """
-    The function returns named tuple (date, extension, path)
-    last log file by date that defines in name of that file
-    and satisfies the regular expression "file_pattern"
-    and situtates in "path" folder
+    The function returns list of named tuples (date, extension, path)
+    of log files that satisfy the regular expression "file_pattern"
+    and situtate in "path" folder. The list is sorted by date
+    that defines in name of file.
     """
-    SelectedFile = namedtuple("SelectedFile", "date ext path")
-
     pat = re.compile(file_pattern)
 
-    sel_file = SelectedFile(None, None, None)
+    selected = []
 
     files_list = (os.listdir(path))
 
@@ -29,75 +37,216 @@ def search_last_file(file_pattern, path):
         if re.fullmatch(pat, file):
             temp_list = file.split("-")[-1].split(".")
             try:
-                temp_file = SelectedFile(dt.strptime(temp_list[0], '%Y%m%d'),
-                                         temp_list[1], os.path.join(path, file))
+                selected.append(SelectedFile(dt.strptime(temp_list[0], '%Y%m%d'),
+                                             temp_list[1], os.path.join(path, file)))
             except Exception:
                 logging.exception("Got exception")
-            if sel_file.date is None or temp_file.date > sel_file.date:
-                sel_file = temp_file
 
-    return sel_file
+    selected.sort(key=lambda item: item.date)
+    return selected
+
+
+def search_last_file(file_pattern, path):
+    """
+    The function returns named tuple (date, extension, path)
+    last log file by date that defines in name of that file
+    and satisfies the regular expression "file_pattern"
+    and situtates in "path" folder
+    """
+    files = search_files(file_pattern, path)
+    return files[-1] if files else SelectedFile(None, None, None)
 
 
-def parser(path, ext, errors_counter):
+def settings_key(settings):
+    """
+    The function returns short hash of json-serializable "settings",
+    files saved for different settings get different names by it
+    """
+    return hashlib.md5(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def parse_line(line):
+    """
+    The function parses one raw (bytes) line of log file
+    and returns tuple (url, request_time)
+    """
+    parse = line.decode("utf-8").strip().split(" ")
+    return parse[7], float(parse[-1])
+
+
+def parse_lines(lines, errors_counter, log_format=None, normalizer=None, fields=None, batch_lines=BATCH_LINES):
+    """
+    The function-generator parses raw "lines" and yields tuple
+    (url, request_time) for every line. Unparsed lines are counted
+    in "errors_counter". If nginx "log_format" is set, lines are parsed
+    by batches of "batch_lines" with parser compiled from that format, then tuples
+    of values of "fields" (if they are set) are yielded instead.
+    If "normalizer" is set, urls are collapsed into route templates.
+    """
+    records = _parse_lines(lines, errors_counter, log_format, fields, batch_lines)
+    return normalizer(records) if normalizer is not None else records
+
+
+def _parse_lines(lines, errors_counter, log_format, fields=None, batch_lines=BATCH_LINES):
+    if log_format is not None:
+        parse_block = compile_parser(log_format, tuple(fields)) if fields else compile_parser(log_format)
+        lines = iter(lines)
+        while True:
+            block = list(islice(lines, batch_lines))
+            if not block:
+                break
+            yield from parse_block(block, errors_counter)
+        return
+
+    for line in lines:
+        try:
+            yield parse_line(line)
+        except Exception:
+            count_error(errors_counter)
+
+
+def parser(path, ext, errors_counter, log_format=None, normalizer=None, reader=None, fields=None,
+           batch_lines=BATCH_LINES):
     """
     The function-generator is parsing a report file ("path"
     with extension "ext") and yields tuple (url, request_time)
     for every line of report file.
     The function counts number of Exception that stored in list with one item
     "errors_counter". This parametr should passed into function by link.
+    Lines are read by "reader(path, ext)" if it is set.
+    Other "fields" of "log_format" may be requested as in "parse_lines".
     """
 
+    if reader is not None:
+        yield from parse_lines(reader(path, ext), errors_counter, log_format, normalizer, fields, batch_lines)
+        return
     opener = gzip.open if ext == 'gz' else open
-    with opener(path) as file:
-        for line in file:
-            try:
-                line = line.decode("utf-8").strip()
-                parse = line.split(" ")
-                yield parse[7], float(parse[-1])
-            except Exception:
-                logging.exception("Got exception")
-                errors_counter[0] += 1
+    with opener(path, "rb") as file:
+        yield from parse_lines(file, errors_counter, log_format, normalizer, fields, batch_lines)
 
 
-def analyze(parser):
+class Aggregate:
     """
-    The function is working with generator function and forming
-    list of values for log-file.
-    The list is sorted in ascending order.
+    Per-url partial aggregate of parsed log records.
+    Every url is kept as constant-size "UrlStat", so memory depends
+    on number of distinct urls only.
+    Aggregates built over different parts of one log can be merged.
+    Aggregate that keeps only the heaviest urls has "truncated" set,
+    it can not be merged.
     """
 
-    analyze = {}
-    all_request_count = 0
-    all_request_time_count = 0
-    analyze_list = []
+    def __init__(self):
+        self.urls = {}
+        self.count = 0
+        self.time_sum = 0
+        self.truncated = False
+
+    @classmethod
+    def from_records(cls, records):
+        aggregate = cls()
+        aggregate.update(records)
+        return aggregate
 
-    for url, request_time in parser:
-        all_request_count += 1
-        all_request_time_count += request_time
-        if url not in analyze:
-            analyze[url] = []
-        analyze[url].append(request_time)
+    def update(self, records):
+        """
+        The function adds every (url, request_time) from "records".
+        Vectorized engine is used if numpy is installed
+        """
+        if vectorized.np is not None:
+            vectorized.update_records(self, records)
+            return
+        urls = self.urls
+        count = 0
+        time_sum = 0
+        for url, request_time in records:
+            count += 1
+            time_sum += request_time
+            stat = urls.get(url)
+            if stat is None:
+                stat = urls[url] = UrlStat()
+            stat.add(request_time)
+        self.count += count
+        self.time_sum += time_sum
 
-    for url, time_list in analyze.items():
-        count = len(time_list)
-        count_perc = (count / all_request_count) * 100
-        time_sum = sum(time_list)
-        time_perc = (time_sum / all_request_time_count) * 100
-        time_avg = time_sum / count
-        time_max = max(time_list)
-        time_med = time_list[count // 2]
-        dict_ = {"count": count, "count_perc": count_perc,
-                 "time_sum": time_sum,
-                 "time_perc": time_perc,
-                 "time_avg": time_avg,
-                 "time_max": time_max, "time_med": time_med,
-                 "url": url}
-        analyze_list.append(dict_)
+    def merge(self, other):
+        """
+        The function adds data of "other" aggregate into this one
+        """
+        if self.truncated or other.truncated:
+            raise ValueError("Aggregate with the heaviest urls only can not be merged")
+        urls = self.urls
+        for url, stat in other.urls.items():
+            if url not in urls:
+                urls[url] = stat
+            else:
+                urls[url].merge(stat)
+        self.count += other.count
+        self.time_sum += other.time_sum
+        return self
 
-    analyze_list.sort(key=lambda item: item["time_sum"], reverse=True)
+    def to_dict(self):
+        """
+        The function returns json-serializable state of aggregate
+        """
+        return {"count": self.count, "time_sum": self.time_sum,
+                "urls": {url: stat.to_list() for url, stat in self.urls.items()}}
 
-    return analyze_list
+    @classmethod
+    def from_dict(cls, data):
+        aggregate = cls()
+        aggregate.count = data["count"]
+        aggregate.time_sum = data["time_sum"]
+        aggregate.urls = {url: UrlStat.from_list(stat) for url, stat in data["urls"].items()}
+        return aggregate
+
+    def top(self, size=None):
+        """
+        The function returns list of (url, stat) pairs sorted by time_sum
+        in descending order. If "size" is set only "size" heaviest urls
+        are selected with bounded heap instead of full sort.
+        """
+        def key(item):
+            return item[1].time_sum
+
+        if size is None:
+            return sorted(self.urls.items(), key=key, reverse=True)
+        return heapq.nlargest(size, self.urls.items(), key=key)
+
+
+def make_row(url, stat, all_request_count, all_request_time_count):
+    """
+    The function returns dict with values of report row for "url"
+    """
+    count = stat.count
+    time_sum = stat.time_sum
+    row = {"count": count,
+           "count_perc": (count / all_request_count) * 100,
+           "time_sum": time_sum,
+           "time_perc": (time_sum / all_request_time_count) * 100,
+           "time_avg": time_sum / count,
+           "time_max": stat.time_max, "time_med": stat.quantile(0.5),
+           "url": url}
+    for percentile in PERCENTILES:
+        row[f"time_p{percentile}"] = stat.quantile(percentile / 100)
+    return row
+
+
+def analyze(parser, report_size=None):
+    """
+    The function is working with generator function (or with
+    ready "Aggregate") and forming list of values for log-file.
+    The list is sorted by time_sum in descending order.
+    If "report_size" is set, rows are built only for
+    "report_size" heaviest urls.
+    """
+
+    if isinstance(parser, Aggregate):
+        aggregate = parser
+    else:
+        aggregate = Aggregate.from_records(parser)
+
+    return [make_row(url, stat, aggregate.count, aggregate.time_sum)
+            for url, stat in aggregate.top(report_size)]
 
 
 def analyze_formater(report_size, parser):
@@ -107,13 +256,34 @@ def analyze_formater(report_size, parser):
     with lenght of "report_size" parametr
     """
 
-    list_out = analyze(parser)[0:report_size]
-    for item in list_out:
-        item["count_perc"] = f"{item['count_perc']:.3f}"
-        item["time_sum"] = f"{item['time_sum']:.3f}"
-        item["time_perc"] = f"{item['time_perc']:.3f}"
-        item["time_avg"] = f"{item['time_avg']:.3f}"
-    return list_out
+    return list(formated_rows(report_size, parser))
+
+
+def formated_rows(report_size, parser):
+    """
+    The function-generator yields formated rows of "report_size"
+    heaviest urls one by one, so big reports are not kept in memory
+    """
+    aggregate = parser if isinstance(parser, Aggregate) else Aggregate.from_records(parser)
+    for url, stat in aggregate.top(report_size):
+        item = make_row(url, stat, aggregate.count, aggregate.time_sum)
+        format_row(item)
+        yield item
+
+
+def format_row(item):
+    """
+    The function formats float values of report row "item" in place
+    """
+    item["count_perc"] = f"{item['count_perc']:.3f}"
+    item["time_sum"] = f"{item['time_sum']:.3f}"
+    item["time_perc"] = f"{item['time_perc']:.3f}"
+    item["time_avg"] = f"{item['time_avg']:.3f}"
+    item["time_max"] = f"{item['time_max']:.3f}"
+    item["time_med"] = f"{item['time_med']:.3f}"
+    for percentile in PERCENTILES:
+        key = f"time_p{percentile}"
+        item[key] = f"{item[key]:.3f}"
 
 
 def set_config(path, config):
@@ -129,14 +299,58 @@ def set_config(path, config):
         config[key] = value
 
 
-def write_log_file(template, path, data):
+def script_json(value):
     """
-    The function replaces "data" with pattern(table_json)
-    in "template" file and writes into the "path"
+    The function returns json of "value" that is safe inside html <script>:
+    urls and other values of log can not close the script block
+    """
+    return json.dumps(value).replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026")
+
+
+def write_log_file(template, path, data, tables=(), series=None):
+    """
+    The function writes "template" file into the "path" replacing
+    pattern(table_json) with json array of "data" rows,
+    pattern(tables_json) with list of additional "tables"
+    (dicts with name and rows) and pattern(series_json) with time "series".
+    Rows are written one by one, so "data" may be generator of any size.
     """
     with open(template, "r") as file:
         content = file.read()
-    temp = Template(content)
-    content_with_data = temp.safe_substitute(table_json=data)
+    prefix, placeholder, suffix = content.partition("$table_json")
+    values = {"tables_json": script_json(list(tables)), "series_json": script_json(series)}
+
     with open(path, "w") as file:
-        file.write(content_with_data)
+        file.write(Template(prefix).safe_substitute(values))
+        if placeholder:
+            file.write("[")
+            for number, row in enumerate(data):
+                file.write(",\n" if number else "\n")
+                file.write(script_json(row))
+            file.write("\n]")
+        file.write(Template(suffix).safe_substitute(values))
+
+
+def write_json_lines(path, data):
+    """
+    The function writes every row of "data" into the "path"
+    as json object on its own line
+    """
+    with open(path, "w") as file:
+        for row in data:
+            file.write(json.dumps(row))
+            file.write("\n")
+
+
+def write_csv(path, data):
+    """
+    The function writes rows of "data" into the "path" as csv
+    with header of keys of the first row
+    """
+    with open(path, "w", newline="") as file:
+        writer = None
+        for row in data:
+            if writer is None:
+                writer = csv.DictWriter(file, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
@@ -0,0 +1,175 @@
+import os
+import sys
+import math
+import heapq
+import zlib
+import logging
+import tempfile
+from itertools import islice
+from multiprocessing import Pool
+
+from . import service as sr
+from . import vectorized
+
+MB = 1024 * 1024
+GZ_RATIO = 10
+# typical length of line of log, every line may bring new url
+LINE_BYTES = 200
+# measured memory of one url in aggregate (UrlStat, sketch, dict items
+# and url string) is about 500 bytes, it is doubled for heavy urls
+URL_BYTES = 1024
+# memory of one parsed (url, request_time) record in batch
+RECORD_BYTES = 300
+# memory of buffered line of spill file besides its characters
+LINE_OVERHEAD = sys.getsizeof("") + 8
+# bytes of line of spill file besides its url
+SPILL_LINE_BYTES = 21
+MAX_PARTITIONS = 256
+MAX_DEPTH = 8
+
+
+def worker_budget(max_memory_mb, workers=1):
+    """
+    The function returns bytes of memory of one worker
+    """
+    return max_memory_mb * MB / max(workers, 1)
+
+
+def partitions_count(path, ext, max_memory_mb, workers=1):
+    """
+    The function returns number of partitions for log file "path"
+    so that every partition is aggregated within memory of one
+    of "workers" even if every line has its own url. Partitions
+    are limited by MAX_PARTITIONS, larger ones are splitted later.
+    """
+    lines = os.path.getsize(path) * (GZ_RATIO if ext == "gz" else 1) / LINE_BYTES
+    partitions = math.ceil(lines * URL_BYTES / (worker_budget(max_memory_mb, workers) / 2))
+    return min(max(1, partitions), MAX_PARTITIONS)
+
+
+def spill(records, spill_dir, partitions, buffer_bytes, key=None, prefix="part"):
+    """
+    The function writes (url, request_time) "records" into "partitions"
+    files in "spill_dir" by hash of url and returns list of their paths.
+    Every url gets into exactly one partition. Buffers of files
+    take no more than "buffer_bytes" of memory together.
+    Partition of url is "key(url)" if it is set.
+    """
+    if key is None:
+        def key(url):
+            return zlib.crc32(url.encode("utf-8")) % partitions
+    paths = [os.path.join(spill_dir, f"{prefix}-{index}.tsv") for index in range(partitions)]
+    files = [open(path, "w", encoding="utf-8") for path in paths]
+    buffers = [[] for _ in range(partitions)]
+    buffered = 0
+    try:
+        for url, request_time in records:
+            line = f"{request_time!r}\t{url}\n"
+            buffers[key(url)].append(line)
+            buffered += len(line) + LINE_OVERHEAD
+            if buffered >= buffer_bytes:
+                for file, buffer in zip(files, buffers):
+                    file.writelines(buffer)
+                    buffer.clear()
+                buffered = 0
+        for file, buffer in zip(files, buffers):
+            file.writelines(buffer)
+    finally:
+        for file in files:
+            file.close()
+    return paths
+
+
+def _read_partition(path):
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            request_time, _, url = line.rstrip("\n").partition("\t")
+            yield url, float(request_time)
+
+
+def _update(aggregate, records, batch_lines):
+    if vectorized.np is not None:
+        vectorized.update_records(aggregate, records, batch_lines)
+    else:
+        aggregate.update(records)
+
+
+def _aggregate_partition(args):
+    """
+    The function aggregates one partition file within "budget" bytes
+    and returns tuple (count, time_sum, top) where top is list
+    of "report_size" heaviest (url, stat) pairs of partition.
+    Records are added by bounded batches, partition with more urls
+    than fit into budget is splitted into parts by number of urls
+    estimated from read part, then parts are aggregated one by one.
+    """
+    path, report_size, budget, depth = args
+    max_urls = max(1, int(budget / 2 / URL_BYTES))
+    batch_lines = max(100, int(budget / 4 / RECORD_BYTES))
+    aggregate = sr.Aggregate()
+    records = _read_partition(path)
+    read_bytes = 0
+    while True:
+        batch = list(islice(records, batch_lines))
+        if not batch:
+            break
+        read_bytes += sum(len(url) for url, _ in batch) + SPILL_LINE_BYTES * len(batch)
+        _update(aggregate, batch, batch_lines)
+        del batch
+        if len(aggregate.urls) > max_urls and depth < MAX_DEPTH:
+            records.close()
+            urls = len(aggregate.urls) * os.path.getsize(path) / read_bytes
+            del aggregate
+            parts = min(MAX_PARTITIONS, max(2, math.ceil(urls * 2 / max_urls)))
+            return _split_partition(path, report_size, budget, depth, parts)
+    os.remove(path)
+    return aggregate.count, aggregate.time_sum, aggregate.top(report_size)
+
+
+def _split_partition(path, report_size, budget, depth, parts):
+    logging.debug(f"Partition {path} is over memory budget, it is splitted into {parts} parts")
+    paths = spill(_read_partition(path), os.path.dirname(path), parts, budget / 4,
+                  key=lambda url: hash((depth, url)) % parts, prefix=os.path.basename(path)[:-4])
+    os.remove(path)
+    count, time_sum, tops = 0, 0.0, []
+    for part in paths:
+        part_count, part_time_sum, top = _aggregate_partition((part, report_size, budget, depth + 1))
+        count += part_count
+        time_sum += part_time_sum
+        tops = heapq.nlargest(report_size, tops + top, key=lambda item: item[1].time_sum)
+    return count, time_sum, tops
+
+
+def spill_aggregate(records, report_size, max_memory_mb, partitions, spill_dir=None, workers=1):
+    """
+    The function aggregates "records" that may have more distinct urls
+    than fit into memory. Records are hash partitioned by url into
+    "partitions" spill files in "spill_dir" (temporary directory by default),
+    every partition is aggregated on its own (on "workers" processes,
+    each of them gets its share of "max_memory_mb") and "report_size"
+    heaviest urls of partitions are merged.
+    It returns truncated "Aggregate" with totals of all records and the heaviest urls only.
+    """
+    budget = worker_budget(max_memory_mb, workers)
+    with tempfile.TemporaryDirectory(dir=spill_dir, prefix="spill-") as directory:
+        paths = spill(records, directory, partitions, max_memory_mb * MB / 4)
+        tasks = [(path, report_size, budget, 0) for path in paths]
+        if workers > 1:
+            with Pool(workers) as pool:
+                results = pool.imap_unordered(_aggregate_partition, tasks)
+                aggregate, tops = _merge_results(results, report_size)
+        else:
+            aggregate, tops = _merge_results(map(_aggregate_partition, tasks), report_size)
+    aggregate.urls = dict(tops)
+    aggregate.truncated = True
+    return aggregate
+
+
+def _merge_results(results, report_size):
+    aggregate = sr.Aggregate()
+    tops = []
+    for count, time_sum, top in results:
+        aggregate.count += count
+        aggregate.time_sum += time_sum
+        tops = heapq.nlargest(report_size, tops + top, key=lambda item: item[1].time_sum)
+    return aggregate, tops
@@ -0,0 +1,213 @@
+import math
+from array import array
+
+RELATIVE_ACCURACY = 0.01
+# range and number of fixed log-scale bins of "Histogram"
+HISTOGRAM_MIN = 0.001
+HISTOGRAM_MAX = 100.0
+HISTOGRAM_BINS = 64
+# remembered bins of distinct values shared by all histograms
+HISTOGRAM_CACHE_SIZE = 100000
+
+
+class QuantileSketch:
+    """
+    Mergeable sketch of distribution of values (DDSketch-like).
+    Values are counted in buckets with log-scale bounds, so any quantile
+    is estimated with relative error "RELATIVE_ACCURACY" and memory
+    depends on range of values, not on their number.
+    """
+
+    __slots__ = ("buckets", "zero_count", "count")
+
+    gamma = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+    log_gamma = math.log(gamma)
+
+    def __init__(self):
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value, count=1):
+        self.count += count
+        if value <= 0:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        buckets = self.buckets
+        buckets[index] = buckets.get(index, 0) + count
+
+    def merge(self, other):
+        buckets = self.buckets
+        for index, count in other.buckets.items():
+            buckets[index] = buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def subtract(self, other):
+        """
+        The function removes values of "other" sketch that were merged
+        into this one before
+        """
+        buckets = self.buckets
+        for index, count in other.buckets.items():
+            left = buckets[index] - count
+            if left:
+                buckets[index] = left
+            else:
+                del buckets[index]
+        self.zero_count -= other.zero_count
+        self.count -= other.count
+        return self
+
+    def quantile(self, q):
+        """
+        The function returns estimation of "q" quantile (0 <= q <= 1)
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_list(self):
+        return [self.zero_count, list(self.buckets.items())]
+
+    @classmethod
+    def from_list(cls, data):
+        sketch = cls()
+        sketch.zero_count, buckets = data
+        sketch.buckets = {index: count for index, count in buckets}
+        sketch.count = sketch.zero_count + sum(sketch.buckets.values())
+        return sketch
+
+
+class UrlStat:
+    """
+    Streaming accumulator of request times of one url.
+    Sum of squared times is kept for confidence intervals of samples.
+    """
+
+    __slots__ = ("count", "time_sum", "time_squares", "time_max", "sketch")
+
+    def __init__(self):
+        self.count = 0
+        self.time_sum = 0
+        self.time_squares = 0.0
+        self.time_max = 0
+        self.sketch = QuantileSketch()
+
+    def add(self, request_time):
+        self.count += 1
+        self.time_sum += request_time
+        self.time_squares += request_time * request_time
+        if request_time > self.time_max:
+            self.time_max = request_time
+        self.sketch.add(request_time)
+
+    def merge(self, other):
+        self.count += other.count
+        self.time_sum += other.time_sum
+        self.time_squares += other.time_squares
+        if other.time_max > self.time_max:
+            self.time_max = other.time_max
+        self.sketch.merge(other.sketch)
+        return self
+
+    def subtract(self, other):
+        """
+        The function removes values of "other" accumulator that were
+        merged into this one before. Maximum can not be restored from
+        accumulators, so "time_max" is not changed.
+        """
+        self.count -= other.count
+        self.time_sum -= other.time_sum
+        self.time_squares -= other.time_squares
+        self.sketch.subtract(other.sketch)
+        return self
+
+    def quantile(self, q):
+        """
+        Estimation of "q" quantile. It never exceeds real maximum.
+        """
+        return min(self.sketch.quantile(q), self.time_max)
+
+    def to_list(self):
+        """
+        The function returns json-serializable state of accumulator
+        """
+        return [self.count, self.time_sum, self.time_max, self.sketch.to_list(), self.time_squares]
+
+    @classmethod
+    def from_list(cls, data):
+        stat = cls()
+        # states saved before squares were kept have four items
+        stat.count, stat.time_sum, stat.time_max, sketch = data[:4]
+        stat.time_squares = data[4] if len(data) > 4 else 0.0
+        stat.sketch = QuantileSketch.from_list(sketch)
+        return stat
+
+
+class Histogram:
+    """
+    Histogram of values with "HISTOGRAM_BINS" fixed bins.
+    The first bin counts values below "HISTOGRAM_MIN", the last one
+    values from "HISTOGRAM_MAX", bounds of others grow geometrically,
+    so memory is constant and quantiles have relative error about 10%.
+    """
+
+    __slots__ = ("counts", "count")
+
+    ratio = (HISTOGRAM_MAX / HISTOGRAM_MIN) ** (1 / (HISTOGRAM_BINS - 2))
+    log_ratio = math.log(ratio)
+    # request_time has millisecond resolution, so bins of values
+    # are calculated once and remembered, the cache is cleared
+    # when it grows over HISTOGRAM_CACHE_SIZE values
+    indexes = {}
+
+    def __init__(self):
+        self.counts = array("I", [0]) * HISTOGRAM_BINS
+        self.count = 0
+
+    @classmethod
+    def index(cls, value):
+        if value < HISTOGRAM_MIN:
+            return 0
+        if value >= HISTOGRAM_MAX:
+            return HISTOGRAM_BINS - 1
+        return min(1 + int(math.log(value / HISTOGRAM_MIN) / cls.log_ratio), HISTOGRAM_BINS - 2)
+
+    def add(self, value):
+        index = self.indexes.get(value)
+        if index is None:
+            if len(self.indexes) >= HISTOGRAM_CACHE_SIZE:
+                self.indexes.clear()
+            index = self.indexes[value] = self.index(value)
+        self.counts[index] += 1
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        The function returns geometric middle of bin
+        with "q" quantile (0 <= q <= 1)
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen > rank:
+                break
+        if index == 0:
+            return 0.0
+        if index == HISTOGRAM_BINS - 1:
+            return HISTOGRAM_MAX
+        return HISTOGRAM_MIN * self.ratio ** (index - 0.5)
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta, timezone
+
+from .stats import Histogram
+
+BUCKET_SECONDS = 60
+TOP_URLS = 5
+# number of tracked urls per url of report
+CANDIDATES = 4
+QUANTILES = (50, 90, 95, 99)
+
+MONTHS = {name: number for number, name in enumerate(
+    ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"), 1)}
+
+
+class LocalTimeParser:
+    """
+    The class converts $time_local ("29/Jun/2017:03:50:22 +0300")
+    into unix time. Lines come in order, so time of the minute
+    of previous line is cached and only seconds are converted
+    while the minute is the same.
+    """
+
+    def __init__(self):
+        self.minute = None
+        self.base = 0
+
+    def __call__(self, value):
+        minute = value[:17] + value[20:]
+        if minute != self.minute:
+            offset = int(value[22:24]) * 60 + int(value[24:26])
+            zone = timezone(timedelta(minutes=-offset if value[21] == "-" else offset))
+            self.base = int(datetime(int(value[7:11]), MONTHS[value[3:6]], int(value[0:2]),
+                                     int(value[12:14]), int(value[15:17]), tzinfo=zone).timestamp())
+            self.minute = minute
+        return self.base + int(value[18:20])
+
+
+class TimeSeries:
+    """
+    The class counts request_time into "Histogram" per time bucket
+    of "bucket" seconds for all requests and for heaviest urls.
+    Up to twice "top_urls * CANDIDATES" urls are tracked: when there are
+    more of them only the heaviest half is kept and new urls start
+    with the largest dropped weight (batched space-saving algorithm),
+    so heavy urls are not lost and pruning is amortized.
+    That weight is error bound of url: buckets of url before it was
+    tracked again are missed, so its series is marked approximate.
+    """
+
+    def __init__(self, bucket=BUCKET_SECONDS, top_urls=TOP_URLS):
+        self.bucket = bucket
+        self.top_urls = top_urls
+        self.capacity = max(1, top_urls * CANDIDATES)
+        self.overall = {}
+        self.urls = {}
+        self.dropped = 0.0
+        self.parse_time = LocalTimeParser()
+
+    def add(self, url, time_local, request_time):
+        start = self.parse_time(time_local) // self.bucket * self.bucket
+        histogram = self.overall.get(start)
+        if histogram is None:
+            histogram = self.overall[start] = Histogram()
+        histogram.add(request_time)
+
+        if not self.top_urls:
+            return
+        tracked = self.urls.get(url)
+        if tracked is None:
+            if len(self.urls) >= 2 * self.capacity:
+                self._prune()
+            # [weight, error bound of weight, histograms by bucket]
+            tracked = self.urls[url] = [self.dropped, self.dropped, {}]
+        tracked[0] += request_time
+        histogram = tracked[2].get(start)
+        if histogram is None:
+            histogram = tracked[2][start] = Histogram()
+        histogram.add(request_time)
+
+    def _prune(self):
+        heaviest = sorted(self.urls.items(), key=lambda item: item[1][0], reverse=True)
+        self.dropped = max(self.dropped, heaviest[self.capacity][1][0])
+        self.urls = dict(heaviest[:self.capacity])
+
+    def _series(self, histograms, starts):
+        series = {"count": [histograms[start].count if start in histograms else 0 for start in starts]}
+        for quantile in QUANTILES:
+            series[f"p{quantile}"] = [round(histograms[start].quantile(quantile / 100), 3)
+                                      if start in histograms else None for start in starts]
+        return series
+
+    def to_dict(self, urls=()):
+        """
+        The function returns json-serializable time series: start and
+        bucket of series in seconds, count and quantiles of request_time
+        per bucket for all requests and for tracked urls of "urls"
+        (up to "top_urls" ones). Series of url that could miss
+        buckets after pruning has "approximate" flag set.
+        """
+        if not self.overall:
+            return None
+        first, last = min(self.overall), max(self.overall)
+        starts = range(first, last + 1, self.bucket)
+        result = {"start": first, "bucket": self.bucket,
+                  "overall": self._series(self.overall, starts), "urls": []}
+        for url in [url for url in urls if url in self.urls][:self.top_urls]:
+            dummy_weight, error, histograms = self.urls[url]
+            result["urls"].append(dict(self._series(histograms, starts), url=url, approximate=error > 0))
+        return result
@@ -0,0 +1,103 @@
+import math
+from itertools import islice
+
+from .stats import QuantileSketch, UrlStat
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BATCH_LINES = 1000000
+
+
+def _bucket_indexes(times):
+    """
+    The function returns sketch bucket index for every value of "times"
+    and mask of values that are counted as zeros. Indexes are calculated
+    with math.log for every distinct value, so they are exactly the same
+    as in "QuantileSketch.add"
+    """
+    values, inverse = np.unique(times, return_inverse=True)
+    indexes = np.array([math.ceil(math.log(value) / QuantileSketch.log_gamma) if value > 0 else 0
+                        for value in values.tolist()], dtype=np.int64)
+    return indexes[inverse], values[inverse] <= 0
+
+
+def update_arrays(aggregate, urls, ids, times):
+    """
+    The function adds batch of records given as arrays into "aggregate":
+    "ids" are indexes in list "urls", "times" are request times.
+    Count, sum, sum of squares, max and sketch of every url are
+    calculated with grouped numpy operations; results are exactly
+    the same as for adding records one by one.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    times = np.asarray(times, dtype=np.float64)
+    if not len(ids):
+        return
+    present, local = np.unique(ids, return_inverse=True)
+    stats = []
+    for url_id in present.tolist():
+        stat = aggregate.urls.get(urls[url_id])
+        if stat is None:
+            stat = aggregate.urls[urls[url_id]] = UrlStat()
+        stats.append(stat)
+
+    # previous sum of url is the first item of its sequence,
+    # so sums are accumulated in the same order as one by one
+    previous = np.array([stat.time_sum for stat in stats], dtype=np.float64)
+    sums = np.bincount(np.concatenate((np.arange(len(present)), local)),
+                       weights=np.concatenate((previous, times)))
+    previous = np.array([stat.time_squares for stat in stats], dtype=np.float64)
+    squares = np.bincount(np.concatenate((np.arange(len(present)), local)),
+                          weights=np.concatenate((previous, times * times)))
+    counts = np.bincount(local, minlength=len(present))
+    maxes = np.zeros(len(present))
+    np.maximum.at(maxes, local, times)
+
+    indexes, zeros = _bucket_indexes(times)
+    zero_counts = np.bincount(local[zeros], minlength=len(present))
+    for position, stat in enumerate(stats):
+        stat.count += int(counts[position])
+        stat.time_sum = float(sums[position])
+        stat.time_squares = float(squares[position])
+        if maxes[position] > stat.time_max:
+            stat.time_max = float(maxes[position])
+        stat.sketch.count += int(counts[position])
+        stat.sketch.zero_count += int(zero_counts[position])
+
+    # sketch buckets are counted by pairs (url, bucket index)
+    positive = ~zeros
+    if not positive.any():
+        return
+    local, indexes = local[positive], indexes[positive]
+    offset = int(indexes.min())
+    width = int(indexes.max()) - offset + 1
+    keys, key_counts = np.unique(local * width + (indexes - offset), return_counts=True)
+    for key, count in zip(keys.tolist(), key_counts.tolist()):
+        position, index = divmod(key, width)
+        buckets = stats[position].sketch.buckets
+        buckets[index + offset] = buckets.get(index + offset, 0) + count
+
+
+def update_records(aggregate, records, batch_lines=BATCH_LINES):
+    """
+    The function adds (url, request_time) "records" into "aggregate"
+    by batches of "batch_lines" records
+    """
+    records = iter(records)
+    time_sum = 0.0
+    while True:
+        batch = list(islice(records, batch_lines))
+        if not batch:
+            break
+        url_ids = {}
+        ids = np.fromiter((url_ids.setdefault(url, len(url_ids)) for url, _ in batch),
+                          dtype=np.int64, count=len(batch))
+        times = np.fromiter((request_time for _, request_time in batch),
+                            dtype=np.float64, count=len(batch))
+        update_arrays(aggregate, list(url_ids), ids, times)
+        aggregate.count += len(batch)
+        time_sum = float(np.cumsum(np.concatenate(([time_sum], times)))[-1])
+    aggregate.time_sum += time_sum
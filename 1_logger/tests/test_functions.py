@@ -1,6 +1,12 @@
 import unittest
 import os
+import gzip
 import shutil
+import random
+import json
+import csv
+import tracemalloc
+from unittest.mock import patch
 from datetime import datetime as dt
 
 # adding absolute path to sys.path for possibility import tested functions from ../service
@@ -9,6 +15,24 @@ if __name__ == '__main__' and __package__ is None:
     from os import sys, path
     sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 from src.service import service as sr
+from src.service import parallel
+from src.service import stats
+from src.service import checkpoint
+from src.service import logformat
+from src.service import columnar
+from src.service import vectorized
+from src.service import normalize
+from src.service import pipeline
+from src.service import mapped
+from src.service import spill
+from src.service import sample
+from src.service import approximate
+from src.service import grouping
+from src.service import timeseries
+from src.service import follow
+from src.service import profiling
+from benchmarks import generate_log
+import log_analyzer
 
 
 def template_generate(start, ext):
@@ -68,5 +92,793 @@ class ParserTest(unittest.TestCase):
         self.failUnlessEqual(test_string, self.fixture)
 
 
+class CompiledParserTest(unittest.TestCase):
+
+    _path = ("test.gz")
+
+    def setUp(self):
+        with gzip.open(self._path) as file:
+            self.lines = file.read().splitlines(keepends=True)
+
+    def testEqual(self):
+        errors_counter = [0]
+        parsed = list(sr.parse_lines(self.lines, errors_counter, log_analyzer.LOG_FORMAT))
+        self.assertEqual(parsed, list(sr.parse_lines(self.lines, [0])))
+        self.assertEqual(errors_counter[0], 0)
+
+    def testFields(self):
+        parse_block = logformat.compile_parser(log_analyzer.LOG_FORMAT,
+                                               ("status", "http_user_agent", "time_local", "request_time"))
+        self.assertEqual(parse_block(self.lines[:1], [0]),
+                         [(200, "Lynx/2.8.8dev.9 libwww-FM/2.14 SSL-MM/1.4.1 GNUTLS/2.10.5",
+                           "29/Jun/2017:03:50:22 +0300", 0.390)])
+
+    def testErrors(self):
+        errors_counter = [0]
+        parse_block = logformat.compile_parser(log_analyzer.LOG_FORMAT)
+        self.assertEqual(parse_block([b"broken line\n"] + self.lines[:1], errors_counter),
+                         [("/api/v2/banner/25019354", 0.390)])
+        self.assertEqual(errors_counter[0], 1)
+
+
+class PipelineTest(unittest.TestCase):
+
+    _path = ("test.gz")
+    _multi = ("test_multi.gz")
+
+    def setUp(self):
+        with gzip.open(self._path) as file:
+            self.content = file.read()
+        with open(self._multi, "wb") as file:
+            file.write(gzip.compress(self.content[:5000]))
+            file.write(gzip.compress(self.content[5000:]))
+
+    def tearDown(self):
+        os.remove(self._multi)
+
+    def testEqual(self):
+        for queue_depth in (0, 2):
+            lines = list(pipeline.pipelined_lines(self._multi, "gz", block_size=100, queue_depth=queue_depth))
+            self.assertEqual(lines, self.content.splitlines(keepends=True))
+
+    def testOffset(self):
+        blocks = pipeline.pipelined_blocks(self._multi, "gz", offset=6000, block_size=100)
+        self.assertEqual(b"".join(blocks), self.content[6000:])
+
+    def testClose(self):
+        blocks = pipeline.pipelined_blocks(self._path, "gz", block_size=10, queue_depth=1)
+        next(blocks)
+        blocks.close()
+
+
+class MappedRecordsTest(unittest.TestCase):
+
+    _path = ("test.gz")
+    _plain = ("test_mapped.plain")
+
+    def setUp(self):
+        with gzip.open(self._path) as file:
+            self.lines = file.read().splitlines(keepends=True)
+        with open(self._plain, "wb") as file:
+            file.writelines(self.lines[:10] + [b"broken line\n"] + self.lines[10:])
+
+    def tearDown(self):
+        os.remove(self._plain)
+
+    def testEqual(self):
+        errors_counter = [0]
+        records = list(mapped.mapped_records(self._plain, errors_counter, log_analyzer.LOG_FORMAT))
+        self.assertEqual(records, list(sr.parse_lines(self.lines, [0])))
+        self.assertEqual(errors_counter[0], 1)
+
+    def testRanges(self):
+        size = os.path.getsize(self._plain)
+        records = []
+        for start, end in mapped.line_ranges(self._plain, 0, size, 1000):
+            records.extend(mapped.mapped_records(self._plain, [0], log_analyzer.LOG_FORMAT, start, end))
+        self.assertEqual(records, list(sr.parse_lines(self.lines, [0])))
+        self.assertEqual(mapped.complete_lines_end(self._plain, size - 5), size - len(self.lines[-1]))
+
+
+class ParallelAggregateTest(unittest.TestCase):
+
+    _path = ("test.gz")
+    _plain = ("test.plain")
+
+    def setUp(self):
+        with gzip.open(self._path) as src, open(self._plain, "wb") as dst:
+            dst.write(src.read())
+        self.fixture = sr.analyze_formater(100, sr.parser(self._path, "gz", [0]))
+
+    def tearDown(self):
+        os.remove(self._plain)
+
+    def testSplitRanges(self):
+        ranges = parallel.split_ranges(self._plain, 7)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize(self._plain))
+        with open(self._plain, "rb") as file:
+            content = file.read()
+        for start, end in ranges:
+            self.assertEqual(content[end - 1:end], b"\n")
+
+    def testRangeLines(self):
+        with open(self._plain, "rb") as file:
+            content = file.read()
+        for start, end in parallel.split_ranges(self._plain, 3):
+            self.assertEqual(list(parallel.range_lines(self._plain, start, end, 100)),
+                             content[start:end].splitlines())
+
+    def testEqual(self):
+        for path, ext in ((self._path, "gz"), (self._plain, "plain")):
+            errors_counter = [0]
+            aggregate = parallel.parallel_aggregate(path, ext, 3, errors_counter)
+            self.assertEqual(sr.analyze_formater(100, aggregate), self.fixture)
+            self.assertEqual(errors_counter[0], 0)
+
+    def testMapped(self):
+        errors_counter = [0]
+        aggregate = parallel.parallel_aggregate(self._plain, "plain", 3, errors_counter,
+                                                log_analyzer.LOG_FORMAT, mmap_plain=True)
+        self.assertEqual(sr.analyze_formater(100, aggregate), self.fixture)
+        self.assertEqual(errors_counter[0], 0)
+
+    def testTracebacksOfWorker(self):
+        parallel._init_worker()
+        lines = [b"broken line"] * logformat.MAX_TRACEBACKS
+        with self.assertLogs(level="ERROR") as logs:
+            for dummy_task in range(3):
+                aggregate, errors, wall, cpu = parallel._aggregate_lines(lines, None, None)
+                self.assertEqual(errors, logformat.MAX_TRACEBACKS)
+        tracebacks = [record for record in logs.records if record.exc_info]
+        self.assertEqual(len(tracebacks), logformat.MAX_TRACEBACKS)
+
+
+class AnalyzeTopTest(unittest.TestCase):
+
+    _path = ("test.gz")
+
+    def testEqual(self):
+        full = sr.analyze(sr.parser(self._path, "gz", [0]))
+        top = sr.analyze(sr.parser(self._path, "gz", [0]), 5)
+        self.assertEqual(top, full[:5])
+
+
+class CheckpointTest(unittest.TestCase):
+
+    _path = ("test.gz")
+    _plain = ("test.plain")
+    _dir = "./checkpoints"
+
+    def setUp(self):
+        with gzip.open(self._path) as file:
+            self.lines = file.read().splitlines(keepends=True)
+        self.fixture = sr.analyze_formater(100, sr.parser(self._path, "gz", [0]))
+
+    def tearDown(self):
+        os.remove(self._plain)
+        shutil.rmtree(self._dir)
+
+    def testResumeGrownFile(self):
+        half = len(self.lines) // 2
+        with open(self._plain, "wb") as file:
+            file.writelines(self.lines[:half])
+            file.write(self.lines[half][:10])
+        checkpoint.checkpointed_aggregate(self._plain, "plain", self._dir, [0], 100)
+        state = checkpoint.load_checkpoint(self._dir, self._plain)
+        self.assertEqual(state["offset"], sum(len(line) for line in self.lines[:half]))
+        self.assertEqual(state["aggregate"].count, half)
+
+        with open(self._plain, "ab") as file:
+            file.write(self.lines[half][10:])
+            file.writelines(self.lines[half + 1:])
+        aggregate = checkpoint.checkpointed_aggregate(self._plain, "plain", self._dir, [0], 100)
+        self.assertEqual(sr.analyze_formater(100, aggregate), self.fixture)
+
+    def testCompleteLastLine(self):
+        with open(self._plain, "wb") as file:
+            file.writelines(self.lines)
+        with open(self._plain, "rb+") as file:
+            file.truncate(os.path.getsize(self._plain) - 1)
+        past = os.path.getmtime(self._plain) - checkpoint.GROWING_SECONDS - 1
+        os.utime(self._plain, (past, past))
+        aggregate = checkpoint.checkpointed_aggregate(self._plain, "plain", self._dir, [0], 100)
+        self.assertEqual(aggregate.count, len(self.lines))
+
+    def testMapped(self):
+        half = len(self.lines) // 2
+        with open(self._plain, "wb") as file:
+            file.writelines(self.lines[:half])
+            file.write(self.lines[half][:10])
+        checkpoint.checkpointed_aggregate(self._plain, "plain", self._dir, [0], 1000,
+                                          log_format=log_analyzer.LOG_FORMAT, mmap_plain=True)
+        state = checkpoint.load_checkpoint(self._dir, self._plain)
+        self.assertEqual(state["offset"], sum(len(line) for line in self.lines[:half]))
+
+        with open(self._plain, "ab") as file:
+            file.write(self.lines[half][10:])
+            file.writelines(self.lines[half + 1:])
+        aggregate = checkpoint.checkpointed_aggregate(self._plain, "plain", self._dir, [0], 1000,
+                                                      log_format=log_analyzer.LOG_FORMAT, mmap_plain=True)
+        self.assertEqual(sr.analyze_formater(100, aggregate), self.fixture)
+
+    def testSettings(self):
+        with open(self._plain, "wb") as file:
+            file.writelines(self.lines)
+        checkpoint.checkpointed_aggregate(self._plain, "plain", self._dir, [0], 100, settings={"rules": []})
+        self.assertIsNotNone(checkpoint.load_checkpoint(self._dir, self._plain, {"rules": []}))
+        self.assertIsNone(checkpoint.load_checkpoint(self._dir, self._plain, {"rules": [["a", "b"]]}))
+
+
+class ColumnarCacheTest(unittest.TestCase):
+
+    _path = ("test.gz")
+    _dir = "./cache"
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def testEqual(self):
+        self.assertIsNone(columnar.load_cache(self._dir, self._path) if os.path.exists(self._dir) else None)
+        errors_counter = [0]
+        records = sr.parser(self._path, "gz", errors_counter)
+        fixture = sr.analyze_formater(100, columnar.write_cache(self._dir, self._path, records, errors_counter))
+        urls, ids, times, errors = columnar.load_cache(self._dir, self._path)
+        self.assertEqual(len(ids), len(times))
+        self.assertEqual(errors, 0)
+        self.assertEqual(sr.analyze_formater(100, columnar.aggregate_cache(urls, ids, times)), fixture)
+
+    def testSettings(self):
+        errors_counter = [0]
+        records = sr.parser(self._path, "gz", errors_counter)
+        list(columnar.write_cache(self._dir, self._path, records, errors_counter, {"LOG_FORMAT": None}))
+        self.assertIsNotNone(columnar.load_cache(self._dir, self._path, {"LOG_FORMAT": None}))
+        self.assertIsNone(columnar.load_cache(self._dir, self._path, {"LOG_FORMAT": log_analyzer.LOG_FORMAT}))
+
+    def testNormalizedWithoutNumpy(self):
+        normalizer = normalize.UrlNormalizer()
+        errors_counter = [0]
+        records = sr.parser(self._path, "gz", errors_counter)
+        list(columnar.write_cache(self._dir, self._path, records, errors_counter))
+        fixture = sr.Aggregate.from_records(normalizer(sr.parser(self._path, "gz", [0])))
+        urls, ids, times, errors = columnar.load_cache(self._dir, self._path)
+        np, vectorized.np = vectorized.np, None
+        try:
+            aggregate = columnar.aggregate_cache(urls, ids, times, normalizer)
+        finally:
+            vectorized.np = np
+        self.assertEqual(aggregate.count, 50)
+        # cached times are float32, so counts are compared
+        self.assertEqual({url: stat.count for url, stat in aggregate.urls.items()},
+                         {url: stat.count for url, stat in fixture.urls.items()})
+
+
+@unittest.skipIf(vectorized.np is None, "numpy is not installed")
+class VectorizedTest(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(3)
+        self.records = [(f"/url/{int(rnd.paretovariate(1)) % 300}",
+                         rnd.choice([0.0, round(rnd.expovariate(3), 3)])) for _ in range(20000)]
+
+    def testEqual(self):
+        aggregate = sr.Aggregate()
+        vectorized.update_records(aggregate, self.records, 3333)
+        np, vectorized.np = vectorized.np, None
+        try:
+            fixture = sr.analyze(sr.Aggregate.from_records(self.records))
+        finally:
+            vectorized.np = np
+        self.assertEqual(sr.analyze(aggregate), fixture)
+
+
+class SampleTest(unittest.TestCase):
+
+    _path = ("test.gz")
+    _plain = ("test.plain")
+
+    def setUp(self):
+        with gzip.open(self._path) as file:
+            self.lines = file.read().splitlines(keepends=True)
+
+    def tearDown(self):
+        if os.path.exists(self._plain):
+            os.remove(self._plain)
+
+    def testSeeks(self):
+        with open(self._plain, "wb") as file:
+            file.writelines(self.lines)
+            file.writelines(b"broken line\n" for _ in self.lines)
+        sampled = sample.sample_lines(self._plain, "plain", 200, gz_mb=0, seed=1)
+        self.assertEqual(len(sampled), 200)
+        self.assertTrue({line for line, weight in sampled} <= set(self.lines) | {b"broken line\n"})
+        errors, count = sample.estimate_errors(self._plain, "plain", log_analyzer.LOG_FORMAT, 200, 0, seed=1)
+        self.assertEqual(count, 200)
+        self.assertTrue(25 < errors / count * 100 < 75)
+
+    def testGz(self):
+        with open(self._plain, "wb") as file:
+            file.writelines(self.lines)
+        self.assertEqual(sample.estimate_errors(self._path, "gz", log_analyzer.LOG_FORMAT, 20), (0, 20))
+        self.assertEqual(sample.estimate_errors(self._plain, "plain", log_analyzer.LOG_FORMAT, 100),
+                         (0, len(self.lines)))
+
+    def testTracebacks(self):
+        errors_counter = [0]
+        with self.assertLogs(level="ERROR") as logs:
+            list(sr.parse_lines([b"broken line\n"] * 30, errors_counter, log_analyzer.LOG_FORMAT))
+        self.assertEqual(errors_counter[0], 30)
+        self.assertEqual(len(logs.records), logformat.MAX_TRACEBACKS + 1)
+
+
+class ApproximateTest(unittest.TestCase):
+
+    _path = ("test.gz")
+
+    def sample(self, step):
+        reader = approximate.sampling_reader(pipeline.pipelined_lines, step, seed=1)
+        aggregate = approximate.approximate_aggregate(sr.parser(self._path, "gz", [0], reader=reader))
+        return aggregate, approximate.analyze_formater(100, aggregate, step)
+
+    def testWhole(self):
+        aggregate, rows = self.sample(1)
+        for row in rows:
+            self.assertEqual((row.pop("count_perc_ci"), row.pop("time_perc_ci"), row.pop("time_avg_ci")),
+                             ("0.000", "0.000", "0.000"))
+        self.assertEqual(rows, sr.analyze_formater(100, sr.parser(self._path, "gz", [0])))
+
+    def testScaled(self):
+        aggregate, rows = self.sample(3)
+        self.assertIn(aggregate.count, (16, 17))
+        self.assertEqual(sum(row["count"] for row in rows), aggregate.count * 3)
+        for row in rows:
+            self.assertGreaterEqual(float(row["count_perc_ci"]), 0)
+            self.assertGreaterEqual(float(row["time_avg_ci"]), 0)
+
+    def testSeeks(self):
+        with gzip.open(self._path) as file:
+            lines = file.read().splitlines(keepends=True) * 20
+        plain = "test.plain"
+        with open(plain, "wb") as file:
+            file.writelines(lines)
+        try:
+            sampled = list(approximate.seeking_lines(plain, 10, random.Random(1)))
+        finally:
+            os.remove(plain)
+        self.assertTrue(set(sampled) <= set(lines))
+        self.assertTrue(80 <= len(sampled) <= 120)
+
+
+class GroupingTest(unittest.TestCase):
+
+    _path = ("test.gz")
+
+    def testOnePass(self):
+        groupings = [grouping.Grouping("status", ["status"], ["count", "time_sum"]),
+                     grouping.Grouping.from_config({"group_by": ["minute", "url"], "size": 3}),
+                     grouping.Grouping("urls", ["url"])]
+        fields = grouping.fields(groupings)
+        self.assertEqual(fields, ("url", "request_time", "status", "time_local"))
+        records = sr.parser(self._path, "gz", [0], log_analyzer.LOG_FORMAT, fields=fields)
+        aggregate = grouping.grouped_aggregate(records, fields, groupings)
+        fixture = sr.analyze_formater(100, sr.parser(self._path, "gz", [0]))
+        self.assertEqual(sr.analyze_formater(100, aggregate), fixture)
+
+        statuses = groupings[0].rows(aggregate.count, aggregate.time_sum)
+        self.assertEqual(list(statuses[0]), ["status", "count", "time_sum"])
+        self.assertEqual(sum(row["count"] for row in statuses), 50)
+        self.assertEqual(len(groupings[1].rows(aggregate.count, aggregate.time_sum, 10)), 3)
+        self.assertEqual(len(groupings[1].rows(aggregate.count, aggregate.time_sum)[0]["minute"]), 17)
+        for row, expected in zip(groupings[2].rows(aggregate.count, aggregate.time_sum), fixture):
+            self.assertEqual(row, expected)
+
+    def testConflicts(self):
+        searched_file = sr.SelectedFile(None, "gz", self._path)
+        active_config = dict(log_analyzer.config, AGGREGATIONS=[{"group_by": ["status"]}])
+        self.assertEqual(log_analyzer.group_file(active_config, searched_file, [0])[0].count, 50)
+        for key, value in (("WORKERS", 2), ("MAX_MEMORY_MB", 8), ("CACHE_DIR", "./cache")):
+            with self.assertRaisesRegex(ValueError, key):
+                log_analyzer.group_file(dict(active_config, **{key: value}), searched_file, [0])
+
+    def testUnknownMetric(self):
+        with self.assertRaises(ValueError):
+            grouping.Grouping("status", ["status"], ["bytes"])
+
+
+class TimeSeriesTest(unittest.TestCase):
+
+    _path = ("test.gz")
+
+    def testLocalTime(self):
+        parse_time = timeseries.LocalTimeParser()
+        self.assertEqual(parse_time("29/Jun/2017:03:50:22 +0300"),
+                         dt.strptime("29/Jun/2017:03:50:22 +0300", "%d/%b/%Y:%H:%M:%S %z").timestamp())
+        self.assertEqual(parse_time("29/Jun/2017:03:50:59 +0300") - parse_time("29/Jun/2017:03:51:00 +0300"), -1)
+        self.assertEqual(parse_time("01/Jan/2018:00:00:00 -0130"), 1514770200)
+
+    def testHistogram(self):
+        histogram = stats.Histogram()
+        values = [0.0005] + [0.1 * index for index in range(1, 100)] + [150]
+        for value in values:
+            histogram.add(value)
+        self.assertEqual(histogram.quantile(0), 0.0)
+        self.assertEqual(histogram.quantile(1), stats.HISTOGRAM_MAX)
+        self.assertAlmostEqual(histogram.quantile(0.5), 5.0, delta=5.0 * 0.1)
+
+    def testSeries(self):
+        series = timeseries.TimeSeries(60, 2)
+        fields = grouping.fields([], series)
+        aggregate = grouping.grouped_aggregate(sr.parser(self._path, "gz", [0], log_analyzer.LOG_FORMAT,
+                                                         fields=fields), fields, [], series=series)
+        top = [url for url, stat in aggregate.top(10)]
+        result = series.to_dict(top)
+        self.assertEqual(result["bucket"], 60)
+        self.assertEqual(sum(result["overall"]["count"]), aggregate.count)
+        self.assertEqual([item["url"] for item in result["urls"]], top[:2])
+        for item in result["urls"]:
+            self.assertEqual(sum(item["count"]), dict(aggregate.top())[item["url"]].count)
+
+    def testPruned(self):
+        series = timeseries.TimeSeries(60, 1)
+        minutes = ["29/Jun/2017:03:50:00 +0300", "29/Jun/2017:03:51:00 +0300"]
+        series.add("/heavy", minutes[0], 1.0)
+        for index in range(10):
+            series.add(f"/light/{index}", minutes[0], 2.0)
+        series.add("/heavy", minutes[1], 10.0)
+        item = series.to_dict(["/heavy"])["urls"][0]
+        self.assertEqual(item["count"], [0, 1])
+        self.assertTrue(item["approximate"])
+
+    def testHistogramCache(self):
+        for index in range(stats.HISTOGRAM_CACHE_SIZE + 10):
+            stats.Histogram().add(index / 1000000)
+        self.assertLessEqual(len(stats.Histogram.indexes), stats.HISTOGRAM_CACHE_SIZE)
+
+
+class FollowTest(unittest.TestCase):
+
+    _path = ("test.plain")
+    _rotated = ("test.plain.1")
+
+    def setUp(self):
+        with gzip.open("test.gz") as file:
+            self.lines = file.read().splitlines(keepends=True)
+        with open(self._path, "wb") as file:
+            file.writelines(self.lines[:10])
+
+    def tearDown(self):
+        for path in (self._path, self._rotated):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def testTail(self):
+        tail = follow.Tail(self._path)
+        self.assertEqual(tail.read_lines(), [])
+        with open(self._path, "ab") as file:
+            file.writelines(self.lines[10:20])
+            file.write(self.lines[20][:10])
+        self.assertEqual(tail.read_lines(), self.lines[10:20])
+
+        with open(self._path, "ab") as file:
+            file.write(self.lines[20][10:])
+        os.rename(self._path, self._rotated)
+        with open(self._path, "wb") as file:
+            file.writelines(self.lines[21:30])
+        self.assertEqual(tail.read_lines(), self.lines[20:30])
+
+        with open(self._path, "wb") as file:
+            file.writelines(self.lines[30:32])
+        self.assertEqual(tail.read_lines(), self.lines[30:32])
+        tail.close()
+
+    def testWindows(self):
+        rolling = follow.RollingWindows((1, 5), slice_seconds=10)
+        records = list(sr.parse_lines(self.lines, [0]))
+        rolling.update(records[:10], 1000)
+        rolling.update(records[10:30], 1200)
+        rolling.update(records[30:], 1290)
+        aggregates = rolling.aggregates(1300)
+        self.assertEqual(aggregates[1].count, 20)
+        self.assertEqual(aggregates[5].count, 50)
+        self.assertEqual(rolling.aggregates(1500)[5].count, 40)
+        self.assertEqual(len(rolling.slices), 2)
+        self.assertEqual(rolling.slices[-1][1].count, 20)
+
+    def testRunningWindows(self):
+        rolling = follow.RollingWindows((1, 2), slice_seconds=10)
+        records = list(sr.parse_lines(self.lines, [0]))
+        for index, record in enumerate(records):
+            rolling.update([record], 1000 + index * 5)
+        now = 1000 + len(records) * 5
+        for minutes, aggregate in rolling.aggregates(now).items():
+            counted = [record for index, record in enumerate(records)
+                       if (1000 + index * 5) // 10 * 10 + 10 > now - minutes * 60]
+            self.assertEqual(aggregate.count, len(counted))
+            self.assertEqual(sr.analyze_formater(100, aggregate), sr.analyze_formater(100, counted))
+
+    def testNoWindows(self):
+        with self.assertRaises(ValueError):
+            follow.RollingWindows(())
+
+
+class ReportWriterTest(unittest.TestCase):
+
+    _path = ("test.gz")
+    _template = ("template.html")
+    _report = ("report.out")
+
+    def setUp(self):
+        with open(self._template, "w") as file:
+            file.write("var table = $table_json; var tables = $tables_json; $$ $series_json")
+        self.rows = sr.analyze_formater(100, sr.parser(self._path, "gz", [0]))
+
+    def tearDown(self):
+        for path in (self._template, self._report):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def testHtml(self):
+        sr.write_log_file(self._template, self._report, iter(self.rows), [{"name": "t", "rows": []}])
+        with open(self._report) as file:
+            content = file.read()
+        table, _, rest = content[len("var table = "):].partition("; var tables = ")
+        self.assertEqual(json.loads(table), self.rows)
+        self.assertEqual(rest, '[{"name": "t", "rows": []}]; $ null')
+
+    def testScriptEscaped(self):
+        row = {"url": "/</script><script>alert(1)</script>&"}
+        sr.write_log_file(self._template, self._report, [row], [{"name": "<t>", "rows": [row]}], {"url": "</script>"})
+        with open(self._report) as file:
+            content = file.read()
+        self.assertNotIn("<", content)
+        table, _, rest = content[len("var table = "):].partition("; var tables = ")
+        self.assertEqual(json.loads(table), [row])
+
+    def testJsonLines(self):
+        sr.write_json_lines(self._report, iter(self.rows))
+        with open(self._report) as file:
+            self.assertEqual([json.loads(line) for line in file], self.rows)
+
+    def testCsv(self):
+        sr.write_csv(self._report, iter(self.rows))
+        with open(self._report, newline="") as file:
+            rows = list(csv.DictReader(file))
+        self.assertEqual(rows, [{key: str(value) for key, value in row.items()} for row in self.rows])
+
+
+class RunStatsTest(unittest.TestCase):
+
+    _path = ("test.gz")
+
+    def testStages(self):
+        stats = profiling.RunStats()
+        with stats.stage("aggregate"):
+            records = stats.timed("parse", sr.parser(self._path, "gz", [0]), batch=7)
+            aggregate = sr.Aggregate.from_records(records)
+        stats.count("parse", lines=aggregate.count, bytes=os.path.getsize(self._path))
+        result = stats.to_dict()
+        self.assertEqual(set(result["stages"]), {"aggregate", "parse"})
+        parse = result["stages"]["parse"]
+        self.assertEqual(parse["lines"], 50)
+        self.assertAlmostEqual(parse["lines_per_sec"], 50 / parse["wall"])
+        self.assertGreaterEqual(result["wall"], parse["wall"] + result["stages"]["aggregate"]["wall"])
+
+    def testCheckpointed(self):
+        with gzip.open(self._path) as file:
+            lines = file.read().splitlines(keepends=True)
+        plain, directory = "test.plain", "./checkpoints"
+        with open(plain, "wb") as file:
+            file.writelines(lines[:20])
+        try:
+            checkpoint.checkpointed_aggregate(plain, "plain", directory, [0])
+            with open(plain, "ab") as file:
+                file.writelines(lines[20:])
+            stats = profiling.RunStats()
+            with stats.stage("aggregate"):
+                aggregate = checkpoint.checkpointed_aggregate(plain, "plain", directory, [0], stats=stats)
+        finally:
+            os.remove(plain)
+            shutil.rmtree(directory)
+        self.assertEqual(aggregate.count, 50)
+        self.assertEqual(stats.counters["parse"], {"lines": 30, "bytes": len(b"".join(lines[20:])), "errors": 0})
+        self.assertIn("parse", stats.stages)
+
+    def testParallel(self):
+        stats = profiling.RunStats()
+        with stats.stage("aggregate"):
+            parallel.parallel_aggregate(self._path, "gz", 2, [0], stats=stats)
+        self.assertGreater(stats.stages["parse"]["cpu"], 0)
+
+    def testProfiled(self):
+        path = "run.prof"
+        with profiling.profiled(path):
+            sum(range(1000))
+        self.assertTrue(os.path.exists(path))
+        os.remove(path)
+
+
+class SpillAggregateTest(unittest.TestCase):
+
+    _path = ("test.gz")
+
+    def testEqual(self):
+        fixture = sr.analyze_formater(5, sr.parser(self._path, "gz", [0]))
+        for workers in (1, 2):
+            aggregate = spill.spill_aggregate(sr.parser(self._path, "gz", [0]), 5, 1, 4, workers=workers)
+            self.assertEqual(len(aggregate.urls), 5)
+            self.assertEqual(sr.analyze_formater(5, aggregate), fixture)
+            with self.assertRaises(ValueError):
+                sr.Aggregate().merge(aggregate)
+
+    def testPartitions(self):
+        self.assertEqual(spill.partitions_count(self._path, "plain", 1), 1)
+        lines = os.path.getsize(self._path) * spill.GZ_RATIO / spill.LINE_BYTES
+        limit = lines * spill.URL_BYTES * 2 / 3 / 1024 / 1024
+        self.assertEqual(spill.partitions_count(self._path, "gz", limit), 3)
+        self.assertEqual(spill.partitions_count(self._path, "gz", limit, workers=2), 6)
+
+    def testMemoryLimit(self):
+        def records():
+            rnd = random.Random(0)
+            for index in range(100000):
+                yield f"/api/v2/banner/{index % 50000}", rnd.random()
+
+        fixture = sr.analyze_formater(5, records())
+        tracemalloc.start()
+        try:
+            aggregate = spill.spill_aggregate(records(), 5, 2, 4)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 2 * 1024 * 1024)
+        self.assertEqual(aggregate.count, 100000)
+        self.assertEqual([row["url"] for row in sr.analyze_formater(5, aggregate)],
+                         [row["url"] for row in fixture])
+
+
+class GenerateLogTest(unittest.TestCase):
+
+    _path = ("generated.log")
+
+    def tearDown(self):
+        os.remove(self._path)
+
+    def testDeterministic(self):
+        lines = generate_log.generate(self._path, 1, urls=100, malformed=0.01, seed=1)
+        with open(self._path, "rb") as file:
+            data = file.read()
+        self.assertEqual(generate_log.generate(self._path, 1, urls=100, malformed=0.01, seed=1), lines)
+        with open(self._path, "rb") as file:
+            self.assertEqual(file.read(), data)
+        self.assertGreaterEqual(len(data), 1024 * 1024)
+
+    def testParsed(self):
+        errors_counter = [0]
+        lines = generate_log.generate(self._path, 1, urls=100, malformed=0.01)
+        aggregate = sr.Aggregate.from_records(sr.parser(self._path, "plain", errors_counter))
+        self.assertEqual(aggregate.count + errors_counter[0], lines)
+        self.assertAlmostEqual(errors_counter[0] / lines, 0.01, delta=0.005)
+        self.assertLessEqual(len(aggregate.urls), 100)
+
+
+class BatchTest(unittest.TestCase):
+
+    _path = ("test.gz")
+    _dir = "./batch"
+
+    def setUp(self):
+        logs, reports = os.path.join(self._dir, "log"), os.path.join(self._dir, "reports")
+        os.makedirs(logs)
+        os.makedirs(reports)
+        shutil.copy(self._path, os.path.join(logs, "nginx-access-ui.log-20170629.gz"))
+        with gzip.open(self._path) as file:
+            data = file.read()
+        for name in ("nginx-access-ui.log-20170629.plain", "nginx-access-ui.log-20170630.plain"):
+            with open(os.path.join(logs, name), "wb") as file:
+                file.write(data)
+        # the day is reported already and has no checkpoint
+        open(os.path.join(reports, "report-2017.06.30.html"), "w").close()
+        template = os.path.join(self._dir, "template.html")
+        with open(template, "w") as file:
+            file.write("$table_json")
+        self.config = dict(log_analyzer.config, LOG_DIR=logs, REPORT_DIR=reports, TEMPLATE=template,
+                           WORKERS=2, REPORT_SIZE=1000, RUN_STATS=False)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def testRollup(self):
+        log_analyzer.batch(self.config)
+        reports = self.config["REPORT_DIR"]
+        self.assertTrue(os.path.getsize(os.path.join(reports, "report-2017.06.29.html")))
+        self.assertFalse(os.path.getsize(os.path.join(reports, "report-2017.06.30.html")))
+        with open(os.path.join(reports, "report-rollup-2017.06.29-2017.06.30.html")) as file:
+            rows = json.load(file)
+        self.assertEqual(sum(row["count"] for row in rows), 150)
+
+    def testSavedAggregates(self):
+        log_analyzer.batch(self.config)
+        self.assertEqual(len(os.listdir(log_analyzer.aggregates_dir(self.config))), 3)
+        with patch.object(log_analyzer, "aggregate_file", side_effect=AssertionError("parsed again")):
+            log_analyzer.batch(self.config)
+        with open(os.path.join(self.config["REPORT_DIR"], "report-rollup-2017.06.29-2017.06.30.html")) as file:
+            rows = json.load(file)
+        self.assertEqual(sum(row["count"] for row in rows), 150)
+
+    def testMemoryLimit(self):
+        with self.assertRaises(ValueError):
+            log_analyzer.batch(dict(self.config, MAX_MEMORY_MB=1))
+
+    def testParsingModes(self):
+        searched_file = sr.SelectedFile(None, "gz", self._path)
+        for extra in ({"WORKERS": 2, "CHECKPOINT_DIR": "./checkpoints"}, {"CACHE_DIR": "./cache", "MAX_MEMORY_MB": 1}):
+            with self.assertRaisesRegex(ValueError, "can not be used together"):
+                log_analyzer.aggregate_file(dict(self.config, **extra), searched_file, [0])
+        aggregate = log_analyzer.aggregate_file(dict(self.config, MAX_MEMORY_MB=1), searched_file, [0])
+        self.assertEqual(aggregate.count, 50)
+
+    def testCheckpoints(self):
+        checkpoints = os.path.join(self._dir, "checkpoints")
+        self.config["CHECKPOINT_DIR"] = checkpoints
+        log_analyzer.batch(self.config)
+        self.assertEqual(len(os.listdir(checkpoints)), 3)
+        os.remove(os.path.join(self.config["LOG_DIR"], "nginx-access-ui.log-20170630.plain"))
+        log_analyzer.batch(self.config)
+        with open(os.path.join(self.config["REPORT_DIR"], "report-rollup-2017.06.29-2017.06.29.html")) as file:
+            rows = json.load(file)
+        self.assertEqual(sum(row["count"] for row in rows), 100)
+
+
+class UrlNormalizerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.normalizer = normalize.UrlNormalizer([[r"^/export/.*", "/export/*"]], cache_size=2)
+
+    def testEqual(self):
+        cases = {"/api/v2/banner/25019354": "/api/v2/banner/{id}",
+                 "/api/v2/group/7786679/statistic/sites/?date_type=day": "/api/v2/group/{id}/statistic/sites/",
+                 "/u/550e8400-e29b-41d4-a716-446655440000/": "/u/{id}/",
+                 "/api/v2/banner/list": "/api/v2/banner/list",
+                 "/export/a/b/": "/export/*"}
+        for url, template in cases.items():
+            self.assertEqual(self.normalizer.normalize(url), template)
+        self.assertEqual(self.normalizer.normalize.cache_info().currsize, 2)
+
+    def testParallel(self):
+        errors_counter = [0]
+        aggregate = parallel.parallel_aggregate("test.gz", "gz", 2, errors_counter, normalizer=self.normalizer)
+        fixture = sr.Aggregate.from_records(self.normalizer(sr.parser("test.gz", "gz", [0])))
+        self.assertEqual(sr.analyze_formater(100, aggregate), sr.analyze_formater(100, fixture))
+
+
+class UrlStatTest(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(1)
+        self.values = [round(rnd.expovariate(5), 3) for _ in range(10000)]
+
+    def testQuantiles(self):
+        stat = stats.UrlStat()
+        for value in self.values:
+            stat.add(value)
+        ordered = sorted(self.values)
+        self.assertEqual(stat.count, len(ordered))
+        self.assertEqual(stat.time_max, ordered[-1])
+        for q in (0.5, 0.9, 0.99):
+            exact = ordered[int(q * (len(ordered) - 1))]
+            self.assertAlmostEqual(stat.quantile(q), exact,
+                                   delta=exact * stats.RELATIVE_ACCURACY * 1.01)
+
+    def testMerge(self):
+        left, right, whole = stats.UrlStat(), stats.UrlStat(), stats.UrlStat()
+        for index, value in enumerate(self.values):
+            (left if index % 2 else right).add(value)
+            whole.add(value)
+        left.merge(right)
+        self.assertEqual(left.count, whole.count)
+        self.assertEqual(left.sketch.buckets, whole.sketch.buckets)
+        self.assertEqual(left.quantile(0.9), whole.quantile(0.9))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -7,14 +7,23 @@ import datetime
 import logging
 import hashlib
 import uuid
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from optparse import OptionParser
 from http.server import HTTPServer, BaseHTTPRequestHandler
 if __package__:
     from . import scoring
+    from . import store
 else:
     import scoring    
+    import store
 
 SALT = "Otus"
+# threads that handle requests in one process
+WORKERS = 10
 ADMIN_LOGIN = "admin"
 ADMIN_SALT = "42"
 OK = 200
@@ -261,7 +270,7 @@ def clients_interests(req, ctx, store):
     if is_valid is not True:
         return is_valid
     ctx['nclients'] = method_inst.get_context(req.arguments)
-    return {str(item): scoring.get_interests(store, item) for item in method_inst.client_ids}, OK
+    return scoring.get_interests(store, method_inst.client_ids), OK
 
 
 METHODS = {
@@ -323,21 +332,134 @@ class MainHTTPHandler(BaseHTTPRequestHandler):
             r = {"error": response or ERRORS.get(code, "Unknown Error"), "code": code}
         context.update(r)
         logging.info(context)
-        self.wfile.write(json.dumps(r))
+        self.wfile.write(json.dumps(r).encode('utf-8'))
         return
 
 
+class ThreadPoolHTTPServer(HTTPServer):
+    """
+    HTTP server that handles requests in pool of "workers" threads.
+    New connections are not accepted while all threads are busy,
+    so number of requests in process is bounded. Closed server
+    waits for requests in process. With "reuse_port" several
+    servers may listen the same port (SO_REUSEPORT).
+    """
+
+    def __init__(self, server_address, handler, workers=WORKERS, reuse_port=False):
+        self.reuse_port = reuse_port
+        self.slots = threading.BoundedSemaphore(workers)
+        self.executor = ThreadPoolExecutor(workers)
+        super().__init__(server_address, handler)
+
+    def server_bind(self):
+        # allow_reuse_port of socketserver appeared in Python 3.11 only
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        self.slots.acquire()
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
+def init_store(opts):
+    store.init_pool(size=opts.store_pool)
+    ttl = dict(store.LOCAL_CACHE_TTL)
+    for item in opts.local_ttl:
+        prefix, seconds = item.rsplit("=", 1)
+        ttl[prefix] = float(seconds)
+    store.init_local_cache(opts.local_cache, ttl)
+    store.init_breaker(opts.store_failures, opts.store_retry)
+    scoring.INTERESTS_POLICY = opts.interests_policy
+    MainHTTPHandler.store = store
+
+
+def serve(opts, reuse_port=False):
+    """
+    The function serves requests until SIGTERM or KeyboardInterrupt,
+    then stops accepting and waits for requests in process
+    """
+    init_store(opts)
+    server = ThreadPoolHTTPServer(("localhost", opts.port), MainHTTPHandler, opts.workers, reuse_port)
+    # shutdown waits for serve_forever, so it is called from other thread
+    signal.signal(signal.SIGTERM, lambda *args: threading.Thread(target=server.shutdown).start())
+    logging.info("Starting server at %s in process %s" % (opts.port, os.getpid()))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    logging.info("Server in process %s is stopped" % os.getpid())
+
+
+def prefork(opts):
+    """
+    The function starts "opts.processes" servers in child processes,
+    they listen the same port with SO_REUSEPORT, so kernel spreads
+    connections between them. SIGTERM and SIGINT are passed to children.
+    """
+    children = []
+    for dummy_index in range(opts.processes):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                serve(opts, reuse_port=True)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def stop(*args):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while children:
+        pid, dummy_status = os.wait()
+        children.remove(pid)
+
+
 if __name__ == "__main__":
     op = OptionParser()
     op.add_option("-p", "--port", action="store", type=int, default=8080)
     op.add_option("-l", "--log", action="store", default=None)
+    op.add_option("-w", "--workers", action="store", type=int, default=WORKERS,
+                  help="number of threads that handle requests in one process")
+    op.add_option("--processes", action="store", type=int, default=1,
+                  help="number of server processes on the same port, 0 is number of cores")
+    op.add_option("--store-pool", action="store", type=int, default=store.POOL_SIZE,
+                  help="number of persistent connections to memcache")
+    op.add_option("--local-cache", action="store", type=int, default=0,
+                  help="number of values kept in process cache, 0 turns it off")
+    op.add_option("--local-ttl", action="append", default=[], metavar="PREFIX=SECONDS",
+                  help="seconds values of keys with PREFIX live in process cache")
+    op.add_option("--store-failures", action="store", type=int, default=store.FAILURES_TO_OPEN,
+                  help="connection errors in a row after which store is not used")
+    op.add_option("--store-retry", action="store", type=float, default=store.RETRY_SECONDS,
+                  help="seconds between checks of unavailable store")
+    op.add_option("--interests-policy", action="store", type="choice", choices=["empty", "error"],
+                  default=scoring.INTERESTS_POLICY, help="interests of clients while store is unavailable")
     (opts, args) = op.parse_args()
+    opts.processes = opts.processes or os.cpu_count() or 1
     logging.basicConfig(filename=opts.log, level=logging.INFO,
                         format='[%(asctime)s] %(levelname).1s %(message)s', datefmt='%Y.%m.%d %H:%M:%S')
-    server = HTTPServer(("localhost", opts.port), MainHTTPHandler)
-    logging.info("Starting server at %s" % opts.port)
-    try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        pass
-    server.server_close()
+    if opts.processes == 1:
+        serve(opts)
+    else:
+        prefork(opts)
@@ -5,6 +5,9 @@ if __package__:
 else:
     import store
 
+# what clients without cached interests get while store is unavailable:
+# "empty" - no interests, "error" - request fails
+INTERESTS_POLICY = "empty"
 
 
 def get_score(store, phone, email, birthday=None, gender=None, first_name=None, last_name=None):
@@ -34,6 +37,9 @@ def get_score(store, phone, email, birthday=None, gender=None, first_name=None,
     return score
 
 
-def get_interests(store, cid):
-    r = store.get("i:%s" % cid)
-    return json.loads(r) if r else []
+def get_interests(store, cids):
+    keys = {str(cid): "i:%s" % cid for cid in cids}
+    # one multi-get for all clients, missed clients have no interests,
+    # with "error" policy failed store fails the request
+    values = store.get_many(list(keys.values()), strict=INTERESTS_POLICY == "error") or {}
+    return {cid: json.loads(values[key]) if key in values else [] for cid, key in keys.items()}
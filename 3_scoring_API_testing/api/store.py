@@ -1,63 +1,387 @@
 from pymemcache.client import base
+from pymemcache.exceptions import MemcacheUnexpectedCloseError
+from collections import OrderedDict
+import functools
 import logging
-ATTEMPTS_OF_CONNECTIONS = 10
+import threading
+import time
 SERVER_CONFIG = ('localhost', 11211)
+# request waits for store no longer than these seconds, calls are not retried
+CONNECT_TIMEOUT = 0.2
+TIMEOUT = 0.5
+POOL_SIZE = 10
+# connection that was not used for this time is checked before use
+IDLE_SECONDS = 30
+CONNECTION_ERRORS = (OSError, MemcacheUnexpectedCloseError)
+# number of keys in one multi-get request
+GET_MANY_BATCH = 100
+LOCAL_CACHE_SIZE = 10000
+# seconds values live in process cache by key prefix, keys of other prefixes are not cached
+LOCAL_CACHE_TTL = {"uid:": 60, "i:": 10}
+# connection errors in a row that open circuit breaker
+FAILURES_TO_OPEN = 5
+# seconds between background probes of opened store
+RETRY_SECONDS = 5
+PROBE_TIMEOUT = 1
 
 
-def connect(func):
-    def wraper(*args):
-        client = None
-        for dummy_index in range(ATTEMPTS_OF_CONNECTIONS):
+class StoreUnavailable(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    The class keeps up to "size" persistent memcache clients shared
+    by threads of the process. Client is taken for one operation and
+    is returned back, so sockets are reused between requests.
+    Only clients that were idle longer than "idle_seconds" are checked
+    before use, failed clients are closed and replaced by new ones.
+    """
+
+    def __init__(self, server=SERVER_CONFIG, size=POOL_SIZE, idle_seconds=IDLE_SECONDS,
+                 connect_timeout=CONNECT_TIMEOUT, timeout=TIMEOUT):
+        self.server = server
+        self.idle_seconds = idle_seconds
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        # stack of (client, time of last use), the freshest client is taken first
+        self.idle = []
+        self.created = 0
+
+    def _create(self):
+        with self.lock:
+            self.created += 1
+        return base.Client(self.server, connect_timeout=self.connect_timeout, timeout=self.timeout)
+
+    def _healthy(self, client):
+        try:
+            client.version()
+        except Exception:
+            client.close()
+            return False
+        return True
+
+    def acquire(self):
+        self.slots.acquire()
+        try:
+            with self.lock:
+                client, used = self.idle.pop() if self.idle else (None, None)
+            if client is not None and time.monotonic() - used > self.idle_seconds and not self._healthy(client):
+                client = None
+            return client or self._create()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, client, failed=False):
+        if failed:
+            client.close()
+        else:
+            with self.lock:
+                self.idle.append((client, time.monotonic()))
+        self.slots.release()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for client, dummy_used in idle:
+            client.close()
+
+
+class LocalCache:
+    """
+    The class is thread-safe in-process LRU cache of up to "size"
+    values in front of memcache. Value lives "ttl[prefix]" seconds
+    for the longest prefix of its key that is in "ttl", but no longer
+    than expire time it was stored into memcache with.
+    """
+
+    def __init__(self, size=LOCAL_CACHE_SIZE, ttl=None):
+        self.size = size
+        self.ttl = dict(LOCAL_CACHE_TTL if ttl is None else ttl)
+        self.prefixes = sorted(self.ttl, key=len, reverse=True)
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _ttl(self, key):
+        for prefix in self.prefixes:
+            if key.startswith(prefix):
+                return self.ttl[prefix]
+        return 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None and item[1] > now:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item is not None:
+                del self.items[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, expire=0):
+        ttl = self._ttl(key)
+        if expire:
+            ttl = min(ttl, expire)
+        if ttl <= 0 or value is None:
+            return
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + ttl)
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.items)}
+
+
+class CircuitBreaker:
+    """
+    The class stops calls to store after "failures" connection errors
+    in a row. While it is open calls fail fast without network,
+    and background thread calls "probe" every "retry_seconds"
+    (half-open state). Successful probe closes the breaker.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, probe, failures=FAILURES_TO_OPEN, retry_seconds=RETRY_SECONDS):
+        self.probe = probe
+        self.failures = failures
+        self.retry_seconds = retry_seconds
+        self.state = self.CLOSED
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def allow(self):
+        return self.state == self.CLOSED
+
+    def success(self):
+        with self.lock:
+            self.errors = 0
+
+    def failure(self):
+        with self.lock:
+            self.errors += 1
+            if self.state != self.CLOSED or self.errors < self.failures:
+                return
+            self.state = self.OPEN
+        logging.error(f"Store is opened after {self.errors} errors")
+        threading.Thread(target=self._probe, daemon=True).start()
+
+    def _probe(self):
+        while not self.stopped.wait(self.retry_seconds):
+            with self.lock:
+                self.state = self.HALF_OPEN
             try:
-                client = base.Client(SERVER_CONFIG, connect_timeout=20, timeout=20)
-                client.get('test')
+                self.probe()
             except Exception as e:
-                logging.exception(f"{e}. Number of attemts: {dummy_index}")
-            else:
-                break
-        return func(*args, client=client)
-    return wraper
+                logging.info(f"Store is still unavailable: {e}")
+                with self.lock:
+                    self.state = self.OPEN
+                continue
+            with self.lock:
+                self.errors = 0
+                self.state = self.CLOSED
+            logging.info("Store is closed after successful probe")
+            return
 
+    def close(self):
+        self.stopped.set()
 
-@connect
-def cache_set(*args, client):
+
+def probe():
+    """
+    The function checks store with new short-lived connection
+    and drops idle connections of pool that may be broken
+    """
+    client = base.Client(pool.server, connect_timeout=PROBE_TIMEOUT, timeout=PROBE_TIMEOUT)
     try:
-        client.set(*args)
-    except Exception as e:
-        logging.exception(e)
+        client.version()
     finally:
         client.close()
+    pool.close()
 
 
+pool = ConnectionPool()
+breaker = CircuitBreaker(probe)
+# process cache is off until "init_local_cache" is called
+local_cache = None
+
+
+def init_pool(server=SERVER_CONFIG, size=POOL_SIZE, idle_seconds=IDLE_SECONDS):
+    """
+    The function replaces pool of the process by new one
+    """
+    global pool
+    old, pool = pool, ConnectionPool(server, size, idle_seconds)
+    old.close()
+    return pool
+
+
+def init_breaker(failures=FAILURES_TO_OPEN, retry_seconds=RETRY_SECONDS):
+    """
+    The function replaces circuit breaker of the process by new one
+    """
+    global breaker
+    old, breaker = breaker, CircuitBreaker(probe, failures, retry_seconds)
+    old.close()
+    return breaker
+
+
+def available():
+    return breaker.allow()
+
+
+def init_local_cache(size=LOCAL_CACHE_SIZE, ttl=None):
+    """
+    The function turns on process cache of "size" values
+    with "ttl" {prefix: seconds}, zero "size" turns it off
+    """
+    global local_cache
+    local_cache = LocalCache(size, ttl) if size else None
+    return local_cache
+
+
+def connect(func):
+    """
+    The decorator calls "func" once with client of pool. Connection
+    error is counted by circuit breaker and is raised as StoreUnavailable
+    without retries, opened breaker fails at once without network
+    """
+    @functools.wraps(func)
+    def wraper(*args):
+        if not breaker.allow():
+            raise StoreUnavailable(f"Store {pool.server} is unavailable")
+        client = pool.acquire()
+        try:
+            result = func(*args, client=client)
+        except CONNECTION_ERRORS as e:
+            pool.release(client, failed=True)
+            breaker.failure()
+            logging.exception(e)
+            raise StoreUnavailable(f"Store {pool.server} is unavailable") from e
+        except Exception:
+            pool.release(client)
+            raise
+        pool.release(client)
+        breaker.success()
+        return result
+    return wraper
+
 
 @connect
-def cache_get(*args, client):
-    try:
-        value = float(client.get(*args).decode('utf-8'))
-        return value
-    except Exception:
-        return None
-    finally:
-        client.close()
+def _set(*args, client):
+    client.set(*args)
 
 
+@connect
+def _get(key, client):
+    value = client.get(key)
+    return value.decode('utf-8') if value else None
+
 
 @connect
-def get(*args, client):
+def _get_many(keys, client):
+    result = {}
+    for start in range(0, len(keys), GET_MANY_BATCH):
+        for key, value in client.get_many(keys[start:start + GET_MANY_BATCH]).items():
+            if value:
+                result[key] = value.decode('utf-8')
+    return result
+
+
+@connect
+def _delete(*args, client):
+    client.delete(*args)
+
+
+def cache_set(key, value, expire=0):
+    if local_cache is not None:
+        # memcache keeps values as strings
+        local_cache.set(key, str(value), expire)
     try:
-        value = client.get(*args)
-        if value:
-            return value.decode('utf-8')
-        else:
-            return None
+        _set(key, value, expire)
+    except StoreUnavailable:
+        pass
     except Exception as e:
         logging.exception(e)
-    finally:
-        client.close()
 
 
+def cache_get(key):
+    try:
+        return float(get(key))
+    except (TypeError, ValueError):
+        return None
 
-@connect
-def delete(*args, client):
-    client.delete(*args)
-    client.close()
+
+def get(key):
+    value = local_cache.get(key) if local_cache is not None else None
+    if value is not None:
+        return value
+    try:
+        value = _get(key)
+    except StoreUnavailable:
+        return None
+    except Exception as e:
+        logging.exception(e)
+        return None
+    if local_cache is not None:
+        local_cache.set(key, value)
+    return value
+
+
+def get_many(keys, strict=False):
+    """
+    The function returns dict {key: value} of found "keys",
+    keys that are missed in process cache cost one round trip
+    per GET_MANY_BATCH keys. Unavailable store gives found part
+    of keys, or StoreUnavailable is raised if "strict" is set
+    """
+    result = {}
+    missed = []
+    for key in dict.fromkeys(keys):
+        value = local_cache.get(key) if local_cache is not None else None
+        if value is None:
+            missed.append(key)
+        else:
+            result[key] = value
+    if not missed:
+        return result
+    try:
+        fetched = _get_many(missed)
+    except StoreUnavailable:
+        if strict:
+            raise
+        return result
+    except Exception as e:
+        logging.exception(e)
+        return result
+    if local_cache is not None:
+        for key, value in fetched.items():
+            local_cache.set(key, value)
+    result.update(fetched)
+    return result
+
+
+def delete(key):
+    if local_cache is not None:
+        local_cache.delete(key)
+    try:
+        _delete(key)
+    except StoreUnavailable:
+        pass
@@ -5,6 +5,9 @@ import unittest
 from unittest.mock import patch
 import json
 import random
+import time
+import threading
+import http.client
 
 from os import sys, path
 sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
@@ -165,7 +168,8 @@ class TestSuite(unittest.TestCase):
         {"client_ids": [1, 2], "date": "19.07.2017"},
         {"client_ids": [0]},
     ])
-    @patch('api.scoring.get_interests', return_value=["test", "test"])
+    @patch('api.scoring.get_interests',
+           side_effect=lambda store, cids: {str(cid): ["test", "test"] for cid in cids})
     def test_ok_interests_request_with_mock(self, arguments, mock_scoring):
         request = {"account": "horns&hoofs", "login": "h&f", "method": "clients_interests", "arguments": arguments}
         self.set_valid_auth(request)
@@ -177,5 +181,67 @@ class TestSuite(unittest.TestCase):
         self.assertEqual(self.context.get("nclients"), len(arguments["client_ids"]))
 
 
+class SlowHandler(api.MainHTTPHandler):
+    router = {"method": lambda request, ctx, store: (time.sleep(TestServer.delay) or {}, api.OK)}
+
+    def log_message(self, *args):
+        pass
+
+
+class TestServer(unittest.TestCase):
+    delay = 0.3
+    workers = 4
+
+    def setUp(self):
+        self.server = api.ThreadPoolHTTPServer(("localhost", 0), SlowHandler, self.workers)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def post(self, codes):
+        connection = http.client.HTTPConnection("localhost", self.port, timeout=5)
+        try:
+            connection.request("POST", "/method", json.dumps({"method": "test"}))
+            codes.append(connection.getresponse().status)
+        finally:
+            connection.close()
+
+    def test_concurrent_requests(self):
+        codes = []
+        threads = [threading.Thread(target=self.post, args=(codes,)) for _ in range(self.workers)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(codes, [api.OK] * self.workers)
+        self.assertLess(time.monotonic() - started, self.delay * 2)
+
+    def test_shutdown_drains_requests(self):
+        codes = []
+        thread = threading.Thread(target=self.post, args=(codes,))
+        thread.start()
+        time.sleep(self.delay / 3)
+        self.server.shutdown()
+        self.server.server_close()
+        thread.join()
+        self.assertEqual(codes, [api.OK])
+        with self.assertRaises(ConnectionRefusedError):
+            self.post([])
+
+    def test_reuse_port(self):
+        other = api.ThreadPoolHTTPServer(("localhost", 0), SlowHandler, reuse_port=True)
+        try:
+            same = api.ThreadPoolHTTPServer(other.server_address, SlowHandler, reuse_port=True)
+            same.server_close()
+        finally:
+            other.server_close()
+
+
 if __name__ == "__main__":
     unittest.main()
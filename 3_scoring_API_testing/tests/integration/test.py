@@ -1,8 +1,10 @@
 import unittest
 from os import sys, path
 import time
+import socket
 sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
 from api import store
+from api import scoring
 
 
 class TestStore(unittest.TestCase):
@@ -24,6 +26,126 @@ class TestStore(unittest.TestCase):
         time.sleep(2)
         self.assertEqual(store.cache_get("test"), None)
 
+    def test_get_many(self):
+        store.cache_set("test", "1", 10)
+        store.delete("test_missed")
+        self.assertEqual({"test": "1"}, store.get_many(["test", "test_missed", "test"]))
+
+    def test_get_many_batches(self):
+        keys = ["test_%s" % index for index in range(store.GET_MANY_BATCH * 2 + 1)]
+        for key in keys:
+            store.cache_set(key, key, 10)
+        self.assertEqual({key: key for key in keys}, store.get_many(keys))
+
+
+class TestPool(unittest.TestCase):
+    def tearDown(self):
+        store.init_pool()
+
+    def test_reuse(self):
+        pool = store.init_pool(size=2)
+        for cid in range(100):
+            store.get("i:%s" % cid)
+        self.assertEqual(pool.created, 1)
+
+    def test_reconnect(self):
+        pool = store.init_pool(size=2)
+        store.cache_set("test", 1.0, 10)
+        client, dummy_used = pool.idle[-1]
+        client.sock.shutdown(socket.SHUT_RDWR)
+        # broken connection is not retried, it is replaced for the next call
+        self.assertIsNone(store.cache_get("test"))
+        self.assertEqual(1.0, store.cache_get("test"))
+        self.assertEqual(pool.created, 2)
+
+    def test_idle_check(self):
+        pool = store.init_pool(size=2, idle_seconds=0)
+        store.cache_set("test", 1.0, 10)
+        time.sleep(0.01)
+        self.assertEqual(1.0, store.cache_get("test"))
+        self.assertEqual(pool.created, 1)
+
+
+class TestLocalCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = store.init_local_cache(10, {"uid:": 60, "i:": 1})
+
+    def tearDown(self):
+        store.init_local_cache(0)
+
+    def test_hit(self):
+        store.cache_set("uid:test", 1.0, 10)
+        self.assertEqual(1.0, store.cache_get("uid:test"))
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_read_through(self):
+        store.cache_set("i:test", "[]", 10)
+        self.cache.delete("i:test")
+        self.assertEqual({"i:test": "[]"}, store.get_many(["i:test"]))
+        self.assertEqual("[]", store.get("i:test"))
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 1, "size": 1})
+
+    def test_prefix_ttl(self):
+        store.cache_set("i:test", "[]", 10)
+        time.sleep(1)
+        self.assertIsNone(self.cache.get("i:test"))
+        self.assertEqual("[]", store.get("i:test"))
+
+    def test_delete(self):
+        store.cache_set("uid:test", 1.0, 10)
+        store.delete("uid:test")
+        self.assertIsNone(store.cache_get("uid:test"))
+
+    def test_lru(self):
+        for index in range(11):
+            self.cache.set("uid:%s" % index, "1.0")
+        self.assertIsNone(self.cache.get("uid:0"))
+        self.assertEqual(self.cache.stats()["size"], 10)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        # nothing listens on port 1, connections are refused at once
+        store.init_pool(server=("localhost", 1))
+        self.breaker = store.init_breaker(failures=2, retry_seconds=0.1)
+
+    def tearDown(self):
+        store.init_pool()
+        store.init_breaker()
+        scoring.INTERESTS_POLICY = "empty"
+
+    def test_open(self):
+        for dummy_call in range(2):
+            self.assertIsNone(store.cache_get("uid:test"))
+        self.assertEqual(self.breaker.state, store.CircuitBreaker.OPEN)
+        started = time.monotonic()
+        self.assertEqual(3.0, scoring.get_score(store, "79175002040", "stupnikov@otus.ru"))
+        self.assertEqual({"1": [], "2": []}, scoring.get_interests(store, [1, 2]))
+        self.assertLess(time.monotonic() - started, 0.05)
+
+    def test_interests_policy(self):
+        scoring.INTERESTS_POLICY = "error"
+        store.get("i:1")
+        store.get("i:1")
+        with self.assertRaises(store.StoreUnavailable):
+            scoring.get_interests(store, [1, 2])
+
+    def test_interests_policy_before_open(self):
+        scoring.INTERESTS_POLICY = "error"
+        with self.assertRaises(store.StoreUnavailable):
+            scoring.get_interests(store, [1, 2])
+        self.assertTrue(store.available())
+
+    def test_close_after_probe(self):
+        store.get("i:1")
+        store.get("i:1")
+        self.assertFalse(store.available())
+        store.init_pool()
+        time.sleep(0.3)
+        self.assertTrue(store.available())
+        store.cache_set("test", 1.0, 10)
+        self.assertEqual(1.0, store.cache_get("test"))
+
 
 if __name__ == "__main__":
     unittest.main()